@@ -1,16 +1,33 @@
+import os
 import re
 import random
 
+import event_log
+from dictionary_store import LayeredDictionary, MappedDictionary, MappedFuzzyIndex
+from fuzzy import FuzzyIndex, LayeredFuzzyIndex
+from locales import DEFAULT_LOCALE, LocaleRegistry, UnknownLocale, normalize_locale
+from memo import forget, memoize
+from metrics import REGISTRY, Counter
+from rule_engine import VersionedDict, GrammarEngine, PhraseMatcher
+from scenario_engine import Message, ScenarioTable, load_scenario_files
+from session_store import MemoryBackend
+
 # --- AI State & Data ---
 # Keep conversation_state as a stable dict object (do not fully clear it) so references remain valid.
+# It is only used when no session id is given (e.g. the demo below); web
+# sessions live in the session store.
 conversation_state = {
     "scenario": None,
     "step_id": None,
     "user_data": {}
 }
 
+# Per-session conversation state, keyed by session id. Swap in a shared
+# backend (see session_store.SQLiteBackend) with configure_session_store().
+session_store = MemoryBackend()
+
 # Expanded vocabulary / definitions
-DEFINITIONS = {
+DEFINITIONS = VersionedDict({
     "ubiquitous": {"def": "Present, appearing, or found everywhere.", "ex": "Mobile phones are ubiquitous these days."},
     "ephemeral": {"def": "Lasting for a very short time.", "ex": "The beauty of the cherry blossoms is ephemeral."},
     "resilience": {"def": "The capacity to recover quickly from difficulties; toughness.", "ex": "Her resilience in the face of adversity was admirable."},
@@ -22,10 +39,10 @@ DEFINITIONS = {
     "nuance": {"def": "A subtle difference in meaning, expression, or sound.", "ex": "Her argument captured the nuance of the situation."},
     "cogent": {"def": "(of an argument or case) clear, logical, and convincing.", "ex": "He made a cogent case for the new policy."},
     "serendipity": {"def": "The occurrence and development of events by chance in a happy or beneficial way.", "ex": "Finding the old letter was pure serendipity."},
-}
+})
 
-# Expanded vocabulary boost mappings (longer phrases first)
-VOCAB_BOOSTS = {
+# Expanded vocabulary boost mappings (longest phrase wins when several match)
+VOCAB_BOOSTS = VersionedDict({
     'very good': 'outstanding', 'very happy': 'ecstatic', 'very sad': 'despondent',
     'very big': 'colossal', 'very small': 'infinitesimal', 'very tired': 'exhausted',
     'very smart': 'brilliant', 'very angry': 'furious', 'very beautiful': 'exquisite',
@@ -39,10 +56,10 @@ VOCAB_BOOSTS = {
     'use': 'utilize', 'show': 'demonstrate', 'ask': 'inquire', 'tell': 'inform',
     # new boosts
     'very important': 'paramount', 'really good': 'remarkable', 'a lot': 'a great deal',
-}
+})
 
 # Common grammar corrections with safer, well-formed regex patterns
-GRAMMAR_CORRECTIONS = {
+GRAMMAR_CORRECTIONS = VersionedDict({
     r"\bi is\b": "I am", r"\bi has\b": "I have", r"\bi were\b": "I was",
     r"\bhe go\b": "he goes", r"\bhe do\b": "he does", r"\bhe have\b": "he has",
     r"\bshe go\b": "she goes", r"\bshe do\b": "she does", r"\bshe have\b": "she has",
@@ -57,13 +74,77 @@ GRAMMAR_CORRECTIONS = {
     r"\bshould of\b": "should have", r"\bwould of\b": "would have",
     r"\bfor all intensive purposes\b": "for all intents and purposes",
     r"\bi could care less\b": "I couldn't care less",
-}
+})
+
+# Spelling suggestions over DEFINITIONS headwords; built on first use.
+_fuzzy_index = FuzzyIndex(DEFINITIONS)
+
+# All grammar rules compiled into a single matcher; rebuilt when GRAMMAR_CORRECTIONS changes.
+_grammar_engine = GrammarEngine(GRAMMAR_CORRECTIONS)
+
+# Token trie over VOCAB_BOOSTS; rebuilt when VOCAB_BOOSTS changes.
+_vocab_matcher = PhraseMatcher(VOCAB_BOOSTS)
+
+# --- Instrumentation (served at /metrics) ---
+_pass_seconds = REGISTRY.histogram(
+    "chatbot_text_pass_seconds", "Time spent applying the grammar or vocabulary rules to one text.", ["stage"])
+_scenario_transitions = REGISTRY.counter(
+    "chatbot_scenario_transitions_total", "Scenario step transitions.", ["scenario", "from_step", "to_step"])
+
+
+def _collect_rule_metrics():
+    # The engines keep their own counts; they are only turned into metrics when scraped.
+    rule_hits = Counter("chatbot_grammar_rule_hits_total", "Times each grammar rule fired.", ["rule"])
+    for pattern, n in list(_grammar_engine.hits.items()):
+        rule_hits.inc(pattern, amount=n)
+    replacements = Counter("chatbot_vocab_replacements_total", "Vocabulary boosts applied.")
+    replacements.inc(amount=_vocab_matcher.replacements)
+    return [rule_hits, replacements]
+
+
+REGISTRY.add_collector(_collect_rule_metrics)
 
 # --- Utility Functions ---
 
 def add_definition(word, meaning, example=None):
     """Add or update a definition at runtime."""
     DEFINITIONS[word.lower()] = {"def": meaning, "ex": example or ""}
+    _fuzzy_index.add(word.lower())
+
+
+def configure_dictionary(path, cache_size=2048):
+    """Serve definitions from a dictionary file, keeping DEFINITIONS as an overlay.
+
+    The built-in entries and anything added with add_definition take
+    precedence over the file. Suggestions for the file's words come from the
+    index that ``dictionary_store.py build`` writes next to it; only the
+    overlay is indexed in memory.
+    """
+    global DEFINITIONS, _fuzzy_index
+    overlay = DEFINITIONS.overlay if isinstance(DEFINITIONS, LayeredDictionary) else DEFINITIONS
+    base = MappedDictionary(path, cache_size=cache_size)
+    DEFINITIONS = LayeredDictionary(base, overlay)
+    try:
+        base_index = MappedFuzzyIndex(path + ".fuzzy", base)
+    except FileNotFoundError:
+        print(f"No fuzzy index for {path}; suggestions cover only built-in and added words. "
+              f"Rebuild it with dictionary_store.py build.")
+        base_index = None
+    overlay_index = FuzzyIndex(overlay) if base_index is None else \
+        FuzzyIndex(overlay, base_index.max_distance, base_index.prefix_length)
+    _fuzzy_index = LayeredFuzzyIndex(DEFINITIONS, overlay_index, base_index)
+    explain_word.cache.clear()
+
+
+def compile_tables():
+    """Compile every rule table and index now instead of on first use.
+
+    The server calls this before forking workers, so they share the result.
+    """
+    _grammar_engine.compile()
+    _vocab_matcher.compile()
+    _scenario_table.compile()
+    _fuzzy_index.rebuild()
 
 
 def add_vocab_boost(phrase, replacement):
@@ -71,37 +152,53 @@ def add_vocab_boost(phrase, replacement):
     VOCAB_BOOSTS[phrase.lower()] = replacement
 
 
-def reset_conversation():
+def add_grammar_rule(pattern, replacement):
+    """Add or update a grammar correction rule (a regex pattern)."""
+    GRAMMAR_CORRECTIONS[pattern] = replacement
+
+
+def _new_state():
+    return {"scenario": None, "step_id": None, "user_data": {}}
+
+
+def configure_session_store(backend):
+    """Replace the backend used for per-session conversation state."""
+    global session_store
+    session_store = backend
+
+
+def reset_conversation(state=None):
     """Clear current conversation but keep the state structure intact."""
-    conversation_state['scenario'] = None
-    conversation_state['step_id'] = None
-    conversation_state['user_data'] = {}
+    if state is None:
+        state = conversation_state
+    state['scenario'] = None
+    state['step_id'] = None
+    state['user_data'] = {}
 
 
-def get_state():
+def get_state(session_id=None):
     """Return a shallow copy of the conversation state for inspection/testing."""
-    return conversation_state.copy()
-
-# Helper to perform case-insensitive replacement while preserving the original case pattern
-
-def _replace_preserve_case(text, pattern, replacement):
-    def _repl(m):
-        orig = m.group(0)
-        # if all caps
-        if orig.isupper():
-            return replacement.upper()
-        # if capitalized
-        if orig[0].isupper():
-            return replacement[0].upper() + replacement[1:]
-        return replacement
-    return re.sub(pattern, _repl, text, flags=re.IGNORECASE)
+    if session_id is None:
+        return conversation_state.copy()
+    state = session_store.get(session_id)
+    return dict(state) if state is not None else _new_state()
 
 # --- Core text processing ---
 
+def _normalize_whitespace(text):
+    # advanced_grammar_fix strips and collapses whitespace first, so these inputs give the same result.
+    return " ".join(text.split())
+
+
+@memoize(version=lambda: GRAMMAR_CORRECTIONS.version, normalize=_normalize_whitespace)
 def advanced_grammar_fix(text):
     """Clean basic grammar and common misspellings, return a cleaned, nicely punctuated string.
     This function intentionally keeps corrections conservative so we don't change user intent.
     """
+    return _grammar_fix(_grammar_engine, text)
+
+
+def _grammar_fix(engine, text):
     if not text:
         return ""
     text = text.strip()
@@ -111,10 +208,9 @@ def advanced_grammar_fix(text):
     # Normalize whitespace
     text = re.sub(r"\s+", " ", text)
 
-    # Apply corrections with preservation of case
-    corrected = text
-    for pattern, fix in GRAMMAR_CORRECTIONS.items():
-        corrected = _replace_preserve_case(corrected, pattern, fix)
+    # Apply all corrections in one pass, preserving case
+    with _pass_seconds.time("grammar"):
+        corrected = engine.apply(text)
 
     # Ensure sentence starts with a capital
     corrected = corrected[0].upper() + corrected[1:]
@@ -126,42 +222,91 @@ def advanced_grammar_fix(text):
     return corrected
 
 
+@memoize(version=lambda: VOCAB_BOOSTS.version)
 def advanced_vocab_boost(text):
     """Replace common words/phrases with stronger vocabulary. Operates conservatively.
-    Longer phrases are replaced first to avoid partial matches.
+    Phrases match whole words only, and longer phrases win over their parts.
     """
+    return _vocab_boost(_vocab_matcher, text)
+
+
+def _vocab_boost(matcher, text):
     if not text:
         return text
-    boosted = text
-    for phrase, replacement in sorted(VOCAB_BOOSTS.items(), key=lambda i: -len(i[0])):
-        # Use word boundaries where appropriate
-        boosted = re.sub(r'(?i)\\b' + re.escape(phrase) + r'\\b', lambda m: _match_case(replacement, m.group(0)), boosted)
-    return boosted
+    with _pass_seconds.time("vocabulary"):
+        return matcher.apply(text)
+
+
+# --- Streaming versions for large documents ---
+# These take sentence-aligned blocks (see document_stream.sentence_blocks)
+# and yield output pieces lazily; joined, the pieces equal the result of the
+# function above on the whole text.
+
+def grammar_fix_stream(blocks, pack=None):
+    """Streaming advanced_grammar_fix over sentence-aligned blocks, with ``pack``'s rules if given."""
+    engine = pack.grammar_engine if pack is not None else _grammar_engine
+    first = True
+    last = ""
+    for block in blocks:
+        text = " ".join(block.split())
+        if not text:
+            continue
+        with _pass_seconds.time("grammar"):
+            corrected = engine.apply(text)
+        if first:
+            corrected = corrected[0].upper() + corrected[1:]
+            first = False
+        else:
+            corrected = " " + corrected
+        last = corrected[-1]
+        yield corrected
+    if last and last not in ['.', '!', '?']:
+        yield "."
+
+
+def vocab_boost_stream(blocks, pack=None):
+    """Streaming advanced_vocab_boost over sentence-aligned blocks, with ``pack``'s rules if given."""
+    matcher = pack.vocab_matcher if pack is not None else _vocab_matcher
+    for block in blocks:
+        with _pass_seconds.time("vocabulary"):
+            yield matcher.apply(block)
+
+
+STREAM_STAGES = {"grammar": grammar_fix_stream, "vocabulary": vocab_boost_stream}
 
 
-def _match_case(replacement, original):
-    # Preserve capitalization pattern
-    if original.isupper():
-        return replacement.upper()
-    if original[0].isupper():
-        return replacement[0].upper() + replacement[1:]
-    return replacement
+def process_document_stream(blocks, actions, pack=None):
+    """Chain the streaming stages named in ``actions`` (e.g. ["grammar", "vocabulary"]) lazily."""
+    for action in actions:
+        blocks = STREAM_STAGES[action](blocks, pack)
+    return blocks
 
 
+@memoize(version=lambda: DEFINITIONS.version)
 def explain_word(word):
+    return _explain(DEFINITIONS, _fuzzy_index, word, ("resilience", "ephemeral"))
+
+
+def _explain(definitions, fuzzy_index, word, examples):
     word_norm = word.lower().strip()
-    if word_norm in DEFINITIONS:
-        info = DEFINITIONS[word_norm]
+    if word_norm in definitions:
+        info = definitions[word_norm]
         return f"'{word.capitalize()}' means: {info['def']}\n\nExample: \"{info['ex']}\""
-    else:
-        return f"Sorry, I don't have a definition for '{word}'. Try another word like 'resilience' or 'ephemeral'."
+    suggestions = fuzzy_index.suggest(word_norm)
+    if suggestions:
+        options = " or ".join(f"'{s}'" for s in suggestions)
+        return f"Sorry, I don't have a definition for '{word}'. Did you mean {options}?"
+    if not examples:
+        return f"Sorry, I don't have a definition for '{word}'."
+    return f"Sorry, I don't have a definition for '{word}'. Try another word like {' or '.join(f'{w!r}' for w in examples)}."
 
 # --- Scenarios (unchanged data structure but safer access) ---
-SCENARIOS = {
+# Built-in scenarios; more are loaded from SCENARIO_DIR below. See scenario_engine for the step format.
+SCENARIOS = VersionedDict({
     "coffee_shop": {
         "title": "Ordering Coffee", "start_step": "start", "steps": {
-            "start": {"bot": "Hello! Welcome to Lingo Coffee. What can I get for you today?", "keywords": ["coffee", "latte", "cappuccino", "tea"], "next_step": "size"},
-            "size": {"bot": "Excellent choice. What size would you like for your {drink}? We have small, medium, or large.", "keywords": ["small", "medium", "large"], "next_step": "extra"},
+            "start": {"bot": "Hello! Welcome to Lingo Coffee. What can I get for you today?", "keywords": ["coffee", "latte", "cappuccino", "tea"], "slots": {"drink": ["latte", "cappuccino", "coffee", "tea"]}, "next_step": "size"},
+            "size": {"bot": "Excellent choice. What size would you like for your {drink}? We have small, medium, or large.", "keywords": ["small", "medium", "large"], "slots": {"size": ["small", "medium", "large"]}, "next_step": "extra"},
             "extra": {"bot": "One {size} {drink}, coming right up. Would you like anything else? Perhaps a croissant or muffin?", "keywords": ["yes", "no", "croissant", "muffin"], "next_step": "payment"},
             "payment": {"bot": "Alright. Your total is $5.75. Will that be cash or card?", "keywords": ["cash", "card"], "next_step": "end"},
             "end": {"bot": "Thank you. We'll have your order ready in a moment!", "feedback": "Great job! You successfully ordered a drink. This conversation is complete."}
@@ -177,120 +322,233 @@ SCENARIOS = {
         }
     },
     # ... other scenarios unchanged for brevity ...
-}
+})
+
+# Every *.json file in scenario_data/ adds a scenario named after the file.
+SCENARIO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scenario_data")
+SCENARIOS.update(load_scenario_files(SCENARIO_DIR))
+
+# Validated, precompiled form of SCENARIOS; rebuilt when SCENARIOS changes.
+_scenario_table = ScenarioTable(SCENARIOS)
+
+# --- Locale rule packs (see locales.py) ---
+
+class LocalePack:
+    """One locale's rule tables with its own compiled matchers and memoized functions."""
+
+    def __init__(self, code, data):
+        self.code = code
+        self.name = data.get("name", code)
+        self.tts_lang = data.get("tts_lang", code)
+        self.grammar = VersionedDict(data.get("grammar", {}))
+        self.vocabulary = VersionedDict({phrase.lower(): boost for phrase, boost in data.get("vocabulary", {}).items()})
+        self.definitions = VersionedDict({word.lower(): entry for word, entry in data.get("definitions", {}).items()})
+        self.scenarios = VersionedDict(data.get("scenarios", {}))
+        self.grammar_engine = GrammarEngine(self.grammar)
+        self.vocab_matcher = PhraseMatcher(self.vocabulary)
+        self.fuzzy_index = FuzzyIndex(self.definitions)
+        self.scenario_table = ScenarioTable(self.scenarios)
+        examples = tuple(sorted(self.definitions)[:2])
+        self._memo_names = [f"{name}[{code}]" for name in ("advanced_grammar_fix", "advanced_vocab_boost", "explain_word")]
+        self.grammar_fix = memoize(
+            version=lambda: self.grammar.version, normalize=_normalize_whitespace, name=self._memo_names[0],
+        )(lambda text: _grammar_fix(self.grammar_engine, text))
+        self.vocab_boost = memoize(version=lambda: self.vocabulary.version, name=self._memo_names[1])(
+            lambda text: _vocab_boost(self.vocab_matcher, text))
+        self.explain = memoize(version=lambda: self.definitions.version, name=self._memo_names[2])(
+            lambda word: _explain(self.definitions, self.fuzzy_index, word, examples))
+
+    def scenario(self, scenario_id):
+        """This locale's version of a scenario, or the built-in one if the pack has none."""
+        return self.scenario_table.get(scenario_id) or _scenario_table.get(scenario_id)
+
+    def release(self):
+        for name in self._memo_names:
+            forget(name)
+
+
+class _BuiltinPack:
+    """The module-level English tables, behind the same interface as LocalePack."""
+
+    code = tts_lang = DEFAULT_LOCALE
+    name = "English"
+    grammar_engine = _grammar_engine
+    vocab_matcher = _vocab_matcher
+    grammar_fix = staticmethod(advanced_grammar_fix)
+    vocab_boost = staticmethod(advanced_vocab_boost)
+
+    @staticmethod
+    def explain(word):
+        return explain_word(word)  # looked up on each call; configure_dictionary replaces DEFINITIONS
+
+    @staticmethod
+    def scenario(scenario_id):
+        return _scenario_table.get(scenario_id)
+
+
+DEFAULT_PACK = _BuiltinPack()
+
+# Every *.json file in locale_data/ is a pack, loaded on first use.
+LOCALE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "locale_data")
+locale_packs = LocaleRegistry(LOCALE_DIR, LocalePack)
+REGISTRY.add_collector(lambda: locale_packs.collect())
+
+
+def locale_pack(locale=None):
+    """The rule pack for ``locale``; the built-in English one for None or English.
+
+    Raises locales.UnknownLocale if there is no pack for it.
+    """
+    if not locale:
+        return DEFAULT_PACK
+    code = normalize_locale(locale)
+    if code == DEFAULT_LOCALE or code.startswith(DEFAULT_LOCALE + "-"):
+        return DEFAULT_PACK
+    return locale_packs.get(code)
 
-# --- Scenario engine with improved safety and matching ---
 
-def _match_keywords(message, keywords):
-    """Return True if any keyword matches as a whole word in message."""
-    if not keywords:
-        return False
-    for kw in keywords:
-        if re.search(r'(?i)\\b' + re.escape(kw) + r'\\b', message):
-            return True
-    return False
+def configure_locales(directory=None, max_resident=4):
+    """Load locale packs from ``directory`` (default: locale_data/), keeping ``max_resident`` in memory."""
+    global locale_packs
+    locale_packs.clear()
+    locale_packs = LocaleRegistry(directory or LOCALE_DIR, LocalePack, max_resident=max_resident)
 
+# --- Scenario engine with improved safety and matching ---
 
-def scenario_chatbot_response(message, scenario_id):
+def scenario_chatbot_response(message, scenario_id, session_id=None, locale=None):
     """Main driver for scenario-based conversations. Safer formatting and robust defaults.
 
+    State is kept per ``session_id`` in the session store; without one the
+    module-level ``conversation_state`` is used. ``locale`` picks the
+    language pack's version of the scenario (see locale_pack).
     Returns a bot response string. Does not raise exceptions for bad input.
     """
-    if not scenario_id or scenario_id not in SCENARIOS:
+    try:
+        pack = locale_pack(locale)
+    except UnknownLocale:
+        return "Error: Unsupported language selected."
+    scenario = pack.scenario(scenario_id) if scenario_id else None
+    if scenario is None:
         return "Error: Invalid scenario selected."
 
+    state = conversation_state if session_id is None else session_store.get(session_id) or _new_state()
+    if state.get("locale", DEFAULT_LOCALE) != pack.code:
+        # Step ids differ between languages, so switching language starts the scenario over.
+        reset_conversation(state)
+        state["locale"] = pack.code
+    response = _scenario_step(state, message, scenario_id, scenario, session_id)
+    if session_id is not None:
+        session_store.set(session_id, state)
+    return response
+
+
+def _render_step(step, user_data):
+    """Fill a compiled step's template, replacing placeholders only if data exists."""
+    fields = step["fields"]
+    if not fields:
+        return step["bot"]
+    if "summary" in fields:
+        vibe = user_data.get('vibe', 'an enjoyable')
+        activity = user_data.get('activity', '')
+        location = user_data.get('location', '')
+        activity_location = activity or location or "an interesting place"
+        food = user_data.get('food', 'some tasty options')
+        summary = f"A {vibe} trip featuring {activity_location} with a focus on {food}."
+        return step["bot"].format(summary=summary)
+    return step["bot"].format(**{k: user_data.get(k, f"[{k}]") for k in fields})
+
+
+def speakable_texts():
+    """Every fixed string the tutor may be asked to speak, for prebuilt audio packs.
+
+    Scenario prompts without placeholders, feedback (alone and appended to
+    its step's prompt, as scenario replies send it) and dictionary examples.
+    """
+    texts = {"Scenario complete. Well done!"}
+    for scenario_id in SCENARIOS:
+        for step in _scenario_table.get(scenario_id)["steps"].values():
+            feedback = step.get("feedback")
+            if feedback:
+                texts.add(feedback)
+            if not step["fields"]:
+                texts.add(step["bot"])
+                if feedback:
+                    texts.add(step["bot"] + "\n\n" + feedback)
+    for word in DEFINITIONS:
+        example = DEFINITIONS[word].get("ex")
+        if example:
+            texts.add(example)
+    return sorted(texts)
+
+
+def _scenario_step(state, message, scenario_id, scenario, session_id=None):
+    """Advance the conversation held in ``state`` by one message (and record it in the event log)."""
+
     # Initialize or reset the scenario if different
-    if conversation_state.get("scenario") != scenario_id:
-        reset_conversation()
-        conversation_state['scenario'] = scenario_id
-        conversation_state['step_id'] = SCENARIOS[scenario_id]["start_step"]
-        start_step_data = SCENARIOS[scenario_id]["steps"].get(conversation_state['step_id'], {})
-        return start_step_data.get("bot", "Error: Could not start scenario.")
-
-    scenario = SCENARIOS[scenario_id]
-    current_step = scenario["steps"].get(conversation_state.get("step_id"), {})
+    if state.get("scenario") != scenario_id:
+        reset_conversation(state)
+        state['scenario'] = scenario_id
+        state['step_id'] = scenario["start_step"]
+        event_log.scenario_step(scenario_id, state['step_id'], event_log.STARTED, session_id=session_id)
+        return scenario["steps"][state['step_id']]["bot"]
+
+    current_step = scenario["steps"].get(state.get("step_id"))
     if not current_step:
         return "Error: Scenario step not found. Please restart."
 
-    user_message_lower = message.lower() if isinstance(message, str) else ""
-
-    # Data gathering: added more robust whole-word checks
-    step_id = conversation_state.get("step_id")
-    if step_id == "start" and scenario_id == "coffee_shop":
-        if _match_keywords(user_message_lower, ["coffee", "latte", "cappuccino", "tea"]):
-            # prefer the first matched keyword
-            for drink in ["latte", "cappuccino", "coffee", "tea"]:
-                if re.search(rf'(?i)\\b{drink}\\b', user_message_lower):
-                    conversation_state['user_data']["drink"] = drink
-                    break
-    elif step_id == "size" and scenario_id == "coffee_shop":
-        for sz in ["small", "medium", "large"]:
-            if re.search(rf'(?i)\\b{sz}\\b', user_message_lower):
-                conversation_state['user_data']["size"] = sz
+    user_message = Message(message)
+
+    # Data gathering: first listed value of each slot found in the message
+    for name, values in current_step["slots"]:
+        for value, keyword_match in values:
+            if user_message.matches(keyword_match):
+                state['user_data'][name] = value
                 break
-    # Additional scenario parsing can be added here with the same pattern
 
     # Determine next step
     next_step_id = None
-    if "options" in current_step:
-        for option in current_step.get("options", []):
-            if _match_keywords(user_message_lower, option.get("keywords", [])):
-                next_step_id = option.get("next_step")
+    if current_step["options"]:
+        for keyword_match, option_next_step in current_step["options"]:
+            if user_message.matches(keyword_match):
+                next_step_id = option_next_step
                 break
         if not next_step_id:
+            event_log.scenario_step(scenario_id, state['step_id'], event_log.RETRIED, session_id=session_id)
             # Provide clearer prompt listing the option keywords
-            option_keywords = set(k for opt in current_step.get("options", []) for k in opt.get("keywords", []))
-            return f"I didn't quite catch that. Please choose one of: {', '.join(sorted(option_keywords))}.\n\n" + current_step.get('bot', '')
+            return f"I didn't quite catch that. Please choose one of: {', '.join(current_step['option_keywords'])}.\n\n" + current_step['bot']
     else:
-        accept_input = current_step.get("accept_any", False) or not current_step.get("keywords")
-        keywords_expected = current_step.get("keywords", [])
-        keywords_match = False if accept_input else _match_keywords(user_message_lower, keywords_expected)
-        if accept_input or keywords_match:
-            next_step_id = current_step.get("next_step")
+        keywords_expected = current_step["keywords"]
+        if current_step["accept_any"] or not keywords_expected or user_message.matches(current_step["keyword_match"]):
+            next_step_id = current_step["next_step"]
         else:
-            if keywords_expected:
-                return f"Please use words like: {', '.join(keywords_expected)}.\n\n" + current_step.get('bot', '')
-            else:
-                # No keywords expected and not accept_any -> accept as default
-                next_step_id = current_step.get("next_step")
+            event_log.scenario_step(scenario_id, state['step_id'], event_log.RETRIED, session_id=session_id)
+            return f"Please use words like: {', '.join(keywords_expected)}.\n\n" + current_step['bot']
 
     # If no next step id, finish scenario
     if not next_step_id:
+        _scenario_transitions.inc(scenario_id, state['step_id'], "")
+        event_log.scenario_step(scenario_id, state['step_id'], event_log.COMPLETED, session_id=session_id)
         feedback_msg = current_step.get("feedback", "Scenario complete. Well done!")
-        reset_conversation()
+        reset_conversation(state)
         return feedback_msg
 
     # Advance state
-    conversation_state['step_id'] = next_step_id
-    next_step_data = scenario['steps'].get(next_step_id, {})
-    next_bot_message = next_step_data.get('bot', '...')
+    _scenario_transitions.inc(scenario_id, state['step_id'], next_step_id)
+    event_log.scenario_step(scenario_id, state['step_id'], event_log.ADVANCED, next_step_id, session_id)
+    state['step_id'] = next_step_id
+    next_step_data = scenario['steps'][next_step_id]
 
-    # Build message safely, replacing placeholders only if data exists
     try:
-        if "{summary}" in next_bot_message:
-            ud = conversation_state.get('user_data', {})
-            vibe = ud.get('vibe', 'an enjoyable')
-            activity = ud.get('activity', '')
-            location = ud.get('location', '')
-            activity_location = activity or location or "an interesting place"
-            food = ud.get('food', 'some tasty options')
-            summary = f"A {vibe} trip featuring {activity_location} with a focus on {food}."
-            bot_response = next_bot_message.format(summary=summary)
-        else:
-            # Find placeholders and fill only when available
-            expected_keys = re.findall(r"\{(.*?)\}", next_bot_message)
-            safe_user_data = {}
-            for k in expected_keys:
-                safe_user_data[k] = conversation_state.get('user_data', {}).get(k, f"[{k}]")
-            bot_response = next_bot_message.format(**safe_user_data)
-    except Exception as e:
+        bot_response = _render_step(next_step_data, state.get('user_data', {}))
+    except Exception:
         # Fallback: return the raw message without formatting if anything goes wrong
-        bot_response = next_step_data.get('bot', 'Okay, let\'s continue.')
+        bot_response = next_step_data['bot']
 
     # Append feedback and reset if this is a final step
     if 'feedback' in next_step_data:
         bot_response += "\n\n" + next_step_data['feedback']
-        reset_conversation()
+        event_log.scenario_step(scenario_id, next_step_id, event_log.COMPLETED, session_id=session_id)
+        reset_conversation(state)
 
     return bot_response
 
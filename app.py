@@ -1,105 +1,463 @@
-from flask import Flask, render_template, request, jsonify, send_file
-from gtts import gTTS
+from flask import Flask, Response, g, render_template, request, jsonify, send_file, stream_with_context, url_for
 import io
+import itertools
+import json
+import os
+import time
+import uuid
 
 # Import the functions and state from our AI logic file
 from ai_logic import (
     advanced_grammar_fix,
-    advanced_vocab_boost,
-    explain_word,
     scenario_chatbot_response,
-    conversation_state # Import the state to handle chat continuity
+    process_document_stream,
+    STREAM_STAGES,
+    get_state, # Per-session state to handle chat continuity
+    configure_session_store,
+    configure_dictionary,
+    configure_locales,
+    locale_pack,
+    GRAMMAR_CORRECTIONS
 )
+from assets import IMMUTABLE, PageCache, StaticAssets, choose_encoding
+from audio_pack import AudioPack
+from batch import BatchProcessor
+from document_stream import read_text, sentence_blocks
+import event_log
+from incremental import IncrementalChecker
+from locales import UnknownLocale
+from metrics import REGISTRY
+from profiling import RequestProfiler
+from session_store import SQLiteBackend
+from tts_cache import AudioCache, FakeSynthesizer, GTTSSynthesizer, SpeechStreamer, SynthesisBusy, SynthesisPool
 
 # --- NEW: Import the functions from our Quiz logic file ---
 from quiz_logic import (
-    get_quiz_question,
-    check_quiz_answer
+    get_quiz_question_json,
+    check_quiz_answer,
+    configure_quiz_bank,
+    load_quiz_bank
 )
 
 app = Flask(__name__)
 
+# Share tutor sessions between worker processes when a database path is configured.
+SESSION_DB = os.environ.get("CHATBOT_SESSION_DB")
+if SESSION_DB:
+    configure_session_store(SQLiteBackend(SESSION_DB))
+
+SESSION_COOKIE = "tutor_session"
+QUIZ_COOKIE = "quiz_learner"
+
+# Look definitions up in a memory-mapped dictionary file (see dictionary_store.py).
+DICTIONARY = os.environ.get("CHATBOT_DICTIONARY")
+if DICTIONARY:
+    configure_dictionary(DICTIONARY)
+
+# Rule packs for other target languages are read from CHATBOT_LOCALE_DIR
+# (default: locale_data/) on first use; at most CHATBOT_MAX_LOCALES stay loaded.
+configure_locales(os.environ.get("CHATBOT_LOCALE_DIR"), max_resident=int(os.environ.get("CHATBOT_MAX_LOCALES", 4)))
+
+# Load a large quiz bank (JSONL or SQLite) instead of the built-in QUIZ_DATA.
+QUIZ_BANK = os.environ.get("CHATBOT_QUIZ_BANK")
+if QUIZ_BANK:
+    configure_quiz_bank(load_quiz_bank(QUIZ_BANK))
+
+# Record quiz answers and tutor steps for analytics (see event_log.py).
+EVENT_LOG = os.environ.get("CHATBOT_EVENT_LOG")
+if EVENT_LOG:
+    REGISTRY.add_collector(event_log.configure(EVENT_LOG).collect)
+
+# Batches of at least CHATBOT_BATCH_INLINE items are spread across a process pool.
+MAX_BATCH_ITEMS = int(os.environ.get("CHATBOT_BATCH_MAX_ITEMS", 5000))
+batch_processor = BatchProcessor(
+    workers=int(os.environ.get("CHATBOT_BATCH_WORKERS", 0)) or None,
+    inline_threshold=int(os.environ.get("CHATBOT_BATCH_INLINE", 64)),
+)
+
+# The live editor re-checks only the sentences that changed since its last revision.
+incremental_checker = IncrementalChecker(advanced_grammar_fix, version=lambda: GRAMMAR_CORRECTIONS.version)
+
+# Synthesized speech is cached in memory and on disk, keyed by (text, lang).
+# Cache misses are synthesized on a small bounded pool; when it is saturated,
+# or a request waits longer than CHATBOT_TTS_TIMEOUT, the TTS endpoints answer
+# 503 with Retry-After. CHATBOT_TTS_FAKE_DELAY swaps gTTS for a local fake.
+# Fixed texts are answered from a prebuilt pack (see audio_pack.py) when
+# CHATBOT_AUDIO_PACK points at one.
+TTS_FAKE_DELAY = os.environ.get("CHATBOT_TTS_FAKE_DELAY")
+AUDIO_PACK = os.environ.get("CHATBOT_AUDIO_PACK")
+tts_cache = AudioCache(
+    FakeSynthesizer(float(TTS_FAKE_DELAY)) if TTS_FAKE_DELAY else GTTSSynthesizer(),
+    disk_dir=os.environ.get("CHATBOT_TTS_CACHE_DIR", os.path.join(app.root_path, "tts_cache")),
+    pool=SynthesisPool(
+        workers=int(os.environ.get("CHATBOT_TTS_SYNTH_WORKERS", 2)),
+        max_queue=int(os.environ.get("CHATBOT_TTS_QUEUE", 8)),
+    ),
+    timeout=float(os.environ.get("CHATBOT_TTS_TIMEOUT", 10)),
+    pack=AudioPack(AUDIO_PACK) if AUDIO_PACK else None,
+)
+# Long texts are synthesized sentence by sentence on the same pool and streamed in order.
+tts_streamer = SpeechStreamer(tts_cache)
+REGISTRY.add_collector(tts_cache.collect)
+
+# --- Request instrumentation (served at /metrics) ---
+REQUEST_SECONDS = REGISTRY.histogram(
+    "chatbot_request_seconds", "Request latency by endpoint.", ["endpoint", "method"])
+REQUESTS = REGISTRY.counter(
+    "chatbot_requests_total", "Requests by endpoint and status code.", ["endpoint", "method", "status"])
+REQUEST_ERRORS = REGISTRY.counter(
+    "chatbot_request_errors_total", "Requests that raised or returned a 5xx status.", ["endpoint", "method"])
+IN_FLIGHT = REGISTRY.gauge(
+    "chatbot_requests_in_flight", "Requests currently being handled.", ["endpoint"])
+
+
+def _endpoint_label():
+    # Unmatched URLs share one label so that scanners cannot blow up the label set.
+    return request.endpoint or "unmatched"
+
+@app.before_request
+def _start_request_metrics():
+    g.metrics_start = time.perf_counter()
+    IN_FLIGHT.inc(_endpoint_label())
+
+@app.after_request
+def _record_request_metrics(response):
+    endpoint = _endpoint_label()
+    REQUEST_SECONDS.observe(endpoint, request.method, value=time.perf_counter() - g.metrics_start)
+    REQUESTS.inc(endpoint, request.method, str(response.status_code))
+    g.metrics_status = response.status_code
+    return response
+
+@app.teardown_request
+def _finish_request_metrics(exc):
+    if "metrics_start" not in g:
+        return
+    endpoint = _endpoint_label()
+    IN_FLIGHT.dec(endpoint)
+    # Counted only here: a request that raised also passes through
+    # after_request with the 500 that Flask made for it.
+    if exc is not None or g.get("metrics_status", 0) >= 500:
+        REQUEST_ERRORS.inc(endpoint, request.method)
+
+# --- On-demand profiling (see profiling.py) ---
+PROFILE_DIR = os.environ.get("CHATBOT_PROFILE_DIR")
+profiler = RequestProfiler(
+    PROFILE_DIR,
+    sample_rate=float(os.environ.get("CHATBOT_PROFILE_RATE", 0)),
+    token=os.environ.get("CHATBOT_PROFILE_TOKEN"),
+    keep=int(os.environ.get("CHATBOT_PROFILE_KEEP", 200)),
+) if PROFILE_DIR else None
+
+if profiler is not None:
+    @app.before_request
+    def _start_profile():
+        g.profile = profiler.start(request.headers)
+        if g.profile is not None:
+            g.profile_start = time.perf_counter()
+
+    @app.after_request
+    def _finish_profile_on_close(response):
+        profile = g.pop("profile", None)
+        if profile is not None:
+            finish = _profile_finisher(profile, _endpoint_label(), g.profile_start, request.content_length or 0)
+            if response.is_streamed and not response.direct_passthrough:
+                # A generated body is produced after this hook; stop once it has been sent.
+                response.call_on_close(finish)
+            else:
+                # Files (send_file) bypass the close callbacks, and their content is ready.
+                finish()
+        return response
+
+    @app.teardown_request
+    def _finish_profile(exc):
+        # Only still pending if the request raised before producing a response.
+        profile = g.pop("profile", None)
+        if profile is not None:
+            _profile_finisher(profile, _endpoint_label(), g.profile_start, request.content_length or 0)()
+
+    def _profile_finisher(profile, endpoint, start, input_bytes):
+        return lambda: profiler.finish(profile, endpoint, time.perf_counter() - start, input_bytes)
+
+# --- Static assets and cached pages ---
+# Files under static/ are served from /assets/ with content-hashed names and
+# precompressed bodies; templates use asset_url('css/style.css').
+static_assets = StaticAssets(app.static_folder)
+page_cache = PageCache(render_template)
+app.jinja_env.globals["asset_url"] = lambda filename: url_for("asset", filename=static_assets.url(filename))
+
+
+def _asset_response(asset, cache_control):
+    encoding, body = choose_encoding(request.headers.get("Accept-Encoding"), asset.bodies)
+    response = Response(body, content_type=asset.mimetype)
+    if encoding != "identity":
+        response.headers["Content-Encoding"] = encoding
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = cache_control
+    response.set_etag(f"{asset.etag}-{encoding}")
+    return response.make_conditional(request)
+
+
+def _render_page(template, **context):
+    # Pages depend only on their context, so each is rendered once (except while debugging).
+    if app.debug:
+        return render_template(template, **context)
+    return _asset_response(page_cache.get(template, **context), "no-cache")
+
+@app.route("/assets/<path:filename>")
+def asset(filename):
+    """Serves a fingerprinted static file; its URL changes whenever its content does."""
+    static_asset = static_assets.get(filename)
+    if static_asset is None:
+        return jsonify({"error": "Not found."}), 404
+    return _asset_response(static_asset, IMMUTABLE)
+
 # --- Page Routes ---
 @app.route("/")
 def grammar_page():
     """Renders the main Grammar Checker page."""
-    return render_template("grammar_checker.html", page='grammar')
+    return _render_page("grammar_checker.html", page='grammar')
 
 @app.route("/tutor")
 def tutor_page():
     """Renders the AI Tutor chat page."""
-    return render_template("tutor.html", page='tutor')
+    return _render_page("tutor.html", page='tutor')
 
 # --- NEW: Route for the Quiz Page ---
 @app.route("/quiz")
 def quiz_page():
     """Renders the new Quiz page."""
-    return render_template("quiz.html", page='quiz')
+    return _render_page("quiz.html", page='quiz')
 
 
 # --- API Endpoints ---
 @app.route("/api/process", methods=["POST"])
 def process_text():
-    """Handles requests for grammar, vocab, and word explanations."""
+    """Handles requests for grammar, vocab, and word explanations (in the optional "locale")."""
     data = request.json
     text_input = data.get("text")
     action = data.get("action")
 
     if not text_input:
         return jsonify({"error": "No text provided."}), 400
-    
+
+    pack = locale_pack(data.get("locale"))
     if action == "explain":
-        result_text = explain_word(text_input)
+        result_text = pack.explain(text_input)
     elif action == "grammar": 
-        result_text = advanced_grammar_fix(text_input)
+        result_text = pack.grammar_fix(text_input)
     elif action == "vocabulary": 
-        result_text = advanced_vocab_boost(text_input)
+        result_text = pack.vocab_boost(text_input)
     else: 
         return jsonify({"error": "Invalid action."}), 400
         
     return jsonify({"result": result_text})
 
+@app.route("/api/define/<path:word>", methods=["GET"])
+def define_word(word):
+    """Explains one word (``?locale=`` for other languages); cacheable, with ETag revalidation.
+
+    ``path:`` so that selected text containing "/" still reaches this route.
+    """
+    response = jsonify({"word": word, "result": locale_pack(request.args.get("locale")).explain(word)})
+    response.headers["Cache-Control"] = "public, max-age=300"
+    response.add_etag()
+    return response.make_conditional(request)
+
+@app.route("/api/process/stream", methods=["POST"])
+def process_stream():
+    """Streams grammar/vocabulary results for a large document sent as the raw request body.
+
+    ``?action=grammar,vocabulary`` picks the stages (in order) and
+    ``?format=text`` returns plain text instead of NDJSON pieces, and
+    ``?locale=`` selects another language's rules.
+    """
+    actions = request.args.get("action", "grammar").split(",")
+    output_format = request.args.get("format", "ndjson")
+    if not all(action in STREAM_STAGES for action in actions):
+        return jsonify({"error": "Invalid action."}), 400
+    if output_format not in ("ndjson", "text"):
+        return jsonify({"error": "Invalid format."}), 400
+
+    pack = locale_pack(request.args.get("locale"))
+    pieces = process_document_stream(sentence_blocks(read_text(request.stream)), actions, pack)
+    if output_format == "text":
+        return Response(stream_with_context(pieces), mimetype="text/plain")
+
+    def generate():
+        count = 0
+        for piece in pieces:
+            count += 1
+            yield json.dumps({"text": piece}) + "\n"
+        yield json.dumps({"done": True, "pieces": count}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+@app.route("/api/grammar/incremental", methods=["POST"])
+def incremental_grammar():
+    """Checks a document against the client's last revision, returning only changed sentences."""
+    data = request.json
+    text_input = data.get("text")
+    revision = data.get("revision")
+
+    if text_input is None or not isinstance(text_input, str):
+        return jsonify({"error": "No text provided."}), 400
+
+    return jsonify(incremental_checker.check(text_input, revision))
+
+@app.route("/api/process/batch", methods=["POST"])
+def process_batch():
+    """Handles a list of {text, action} items and returns results in order."""
+    data = request.json
+    items = data.get("items")
+
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "No items provided."}), 400
+    if len(items) > MAX_BATCH_ITEMS:
+        return jsonify({"error": f"Too many items (max {MAX_BATCH_ITEMS})."}), 400
+
+    return jsonify({"results": batch_processor.process(items)})
+
 @app.route("/api/chat", methods=["POST"])
 def chat_with_tutor():
     """Handles requests for the scenario-based AI tutor."""
     data = request.json
     user_message = data.get("message")
     scenario_id = data.get("scenario")
+    session_id = data.get("session_id") or request.cookies.get(SESSION_COOKIE) or uuid.uuid4().hex
     
-    if not user_message and conversation_state["scenario"] != scenario_id:
+    if not user_message and get_state(session_id)["scenario"] != scenario_id:
         user_message = "start"
         
     if not user_message:
         return jsonify({"error": "No message provided."}), 400
         
-    tutor_response = scenario_chatbot_response(user_message, scenario_id)
-    return jsonify({"reply": tutor_response})
+    locale = data.get("locale")
+    locale_pack(locale)  # reject unknown locales with a 400 rather than a chat reply
+    tutor_response = scenario_chatbot_response(user_message, scenario_id, session_id, locale)
+    response = jsonify({"reply": tutor_response, "session_id": session_id})
+    response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite="Lax")
+    return response
         
 @app.route('/api/tts', methods=['POST'])
 def text_to_speech():
-    """Handles text-to-speech requests."""
+    """Handles text-to-speech requests, spoken in the optional "locale"'s language."""
     data = request.json
     text_to_speak = data.get('text')
     
     if not text_to_speak:
         return jsonify({"error": "No text provided for speech."}), 400
 
+    lang = locale_pack(data.get('locale')).tts_lang
     try:
-        mp3_fp = io.BytesIO()
-        tts = gTTS(text_to_speak, lang='en')
-        tts.write_to_fp(mp3_fp)
-        mp3_fp.seek(0)
+        mp3_fp = io.BytesIO(tts_cache.get(text_to_speak, lang=lang))
         return send_file(mp3_fp, mimetype='audio/mpeg', as_attachment=False)
+    except SynthesisBusy as e:
+        return _tts_busy(e)
     except Exception as e:
         print(f"gTTS Error: {e}")
         return jsonify({"error": "Failed to generate audio."}), 500
 
+@app.route('/api/tts/stream', methods=['POST'])
+def text_to_speech_stream():
+    """Streams speech for long texts, one MP3 segment per sentence."""
+    data = request.json
+    text_to_speak = data.get('text')
+
+    if not text_to_speak:
+        return jsonify({"error": "No text provided for speech."}), 400
+
+    chunks = tts_streamer.stream(text_to_speak, lang=locale_pack(data.get('locale')).tts_lang)
+    try:
+        # Wait for the first segment so a saturated synthesizer still gets a proper 503.
+        first = next(chunks, b"")
+    except SynthesisBusy as e:
+        chunks.close()
+        return _tts_busy(e)
+    except Exception as e:
+        chunks.close()
+        print(f"gTTS Error: {e}")
+        return jsonify({"error": "Failed to generate audio."}), 500
+
+    def generate():
+        try:
+            yield from itertools.chain([first], chunks)
+        except Exception as e:
+            # Headers are already sent, so the best we can do is end the stream early.
+            print(f"gTTS Error: {e}")
+
+    return Response(stream_with_context(generate()), mimetype='audio/mpeg')
+
+
+@app.errorhandler(UnknownLocale)
+def _unknown_locale(error):
+    return jsonify({"error": "Unsupported locale."}), 400
+
+@app.errorhandler(404)
+def _not_found(error):
+    # The pages' scripts read API errors as JSON.
+    if request.path.startswith("/api/"):
+        return jsonify({"error": "Not found."}), 404
+    return error
+
+def _tts_busy(error):
+    response = jsonify({"error": "Speech is busy, please try again shortly.", "retry_after": error.retry_after})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response
+
+@app.route('/api/tts/stats', methods=['GET'])
+def tts_cache_stats():
+    """Reports TTS cache hit/miss counters."""
+    return jsonify(tts_cache.stats())
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Exposes request, rule and TTS metrics in Prometheus text format."""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/profiles', methods=['GET'])
+def list_profiles():
+    """Lists the slowest recent request profiles."""
+    denied = _profiles_denied()
+    if denied:
+        return denied
+    limit = request.args.get("limit", 20, type=int)
+    return jsonify({"profiles": profiler.index(limit)})
+
+@app.route('/api/profiles/<name>', methods=['GET'])
+def show_profile(name):
+    """Shows one profile as a pstats report (?sort=cumulative|tottime|calls)."""
+    denied = _profiles_denied()
+    if denied:
+        return denied
+    sort = request.args.get("sort", "cumulative")
+    if sort not in ("cumulative", "tottime", "calls"):
+        return jsonify({"error": "Invalid sort."}), 400
+    report = profiler.summary(name, sort)
+    if report is None:
+        return jsonify({"error": "No such profile."}), 404
+    return Response(report, mimetype="text/plain")
+
+def _profiles_denied():
+    # Profiles expose code paths and timings, so they are only served to holders
+    # of the token; with no token configured the endpoints do not exist.
+    if profiler is None or not profiler.token:
+        return jsonify({"error": "Not found."}), 404
+    if not profiler.authorized(request.headers):
+        return jsonify({"error": "Not authorized."}), 403
+    return None
+
 # --- NEW: API Routes for the Quiz ---
 @app.route("/api/quiz/new", methods=["GET"])
 def new_quiz_question():
-    """Gets a new random question from the quiz logic."""
-    question_data = get_quiz_question()
-    return jsonify(question_data)
+    """Gets the learner's next question; the learner is identified by a cookie."""
+    learner_id = request.cookies.get(QUIZ_COOKIE) or uuid.uuid4().hex
+    payload = get_quiz_question_json(learner_id)
+    if payload is None:
+        return jsonify({"error": "No quiz questions available."}), 404
+    response = Response(payload, mimetype="application/json")
+    response.set_cookie(QUIZ_COOKIE, learner_id, httponly=True, samesite="Lax")
+    return response
 
 @app.route("/api/quiz/check", methods=["POST"])
 def check_answer():
@@ -111,7 +469,7 @@ def check_answer():
     if not question_id or not user_answer:
         return jsonify({"error": "Missing question ID or answer."}), 400
         
-    result = check_quiz_answer(question_id, user_answer)
+    result = check_quiz_answer(question_id, user_answer, request.cookies.get(QUIZ_COOKIE))
     return jsonify(result)
 
 
@@ -0,0 +1,130 @@
+import hashlib
+import mimetypes
+import os
+import threading
+
+# --- Static assets and page caching ---
+# Every file under static/ is read once. It is served under a URL
+# containing a hash of its content (css/style.3f2a9c1b7d4e.css), so the
+# browser may cache it forever, and gzip (plus brotli, if the module is
+# installed) versions are prepared up front. Rendered pages are cached in the
+# same form, keyed by template and context. The work happens on first use
+# (the production server forces it before forking), not at import.
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+_COMPRESSIBLE = ("text/", "application/javascript", "application/json", "image/svg+xml")
+
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def _encodings(data, mimetype, min_size=512):
+    """Identity, gzip and (optionally) brotli bodies, keeping only those that are smaller."""
+    bodies = {"identity": data}
+    if len(data) < min_size or not mimetype.startswith(_COMPRESSIBLE):
+        return bodies
+    import gzip
+    try:
+        import brotli
+    except ImportError:  # optional; gzip is always available
+        brotli = None
+    compressed = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(compressed) < len(data):
+        bodies["gzip"] = compressed
+    if brotli is not None:
+        compressed = brotli.compress(data)
+        if len(compressed) < len(data):
+            bodies["br"] = compressed
+    return bodies
+
+
+def choose_encoding(accept_encoding, bodies):
+    """Pick the smallest body whose encoding the client accepts."""
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if name and params.replace(" ", "") not in ("q=0", "q=0.0"):
+            accepted.add(name.strip().lower())
+    best = "identity"
+    for encoding, body in bodies.items():
+        if encoding in accepted and len(body) < len(bodies[best]):
+            best = encoding
+    return best, bodies[best]
+
+
+class Asset:
+    __slots__ = ("mimetype", "etag", "bodies")
+
+    def __init__(self, data, mimetype):
+        self.mimetype = mimetype
+        self.etag = _digest(data)
+        self.bodies = _encodings(data, mimetype)
+
+
+class StaticAssets:
+    """Fingerprinted, precompressed copies of the files under ``static_dir``."""
+
+    def __init__(self, static_dir):
+        self.static_dir = static_dir
+        self._urls = None  # "css/style.css" -> "css/style.<hash>.css"
+        self._files = None  # fingerprinted name -> Asset
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Read and compress every file now, if not done yet."""
+        if self._files is not None:
+            return
+        with self._lock:
+            if self._files is not None:
+                return
+            urls, files = {}, {}
+            for root, _, names in os.walk(self.static_dir):
+                for name in names:
+                    path = os.path.join(root, name)
+                    relative = os.path.relpath(path, self.static_dir).replace(os.sep, "/")
+                    with open(path, "rb") as f:
+                        data = f.read()
+                    stem, ext = os.path.splitext(relative)
+                    # The built-in table; guess_type() would parse the system MIME database first.
+                    mimetype = mimetypes.types_map.get(ext.lower(), "application/octet-stream")
+                    asset = Asset(data, mimetype)
+                    fingerprinted = f"{stem}.{asset.etag}{ext}"
+                    urls[relative] = fingerprinted
+                    files[fingerprinted] = asset
+            self._urls = urls
+            self._files = files
+
+    def url(self, filename):
+        """Fingerprinted name of ``filename``, or ``filename`` itself if unknown."""
+        self.load()
+        return self._urls.get(filename, filename)
+
+    def get(self, fingerprinted):
+        self.load()
+        return self._files.get(fingerprinted)
+
+
+class PageCache:
+    """Rendered pages as Assets, keyed by template name and context.
+
+    Only for pages whose output depends on nothing but that context.
+    """
+
+    def __init__(self, render):
+        self.render = render
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    def get(self, template, **context):
+        key = (template, tuple(sorted(context.items())))
+        page = self._pages.get(key)
+        if page is None:
+            page = Asset(self.render(template, **context).encode("utf-8"), "text/html; charset=utf-8")
+            with self._lock:
+                self._pages[key] = page
+        return page
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
@@ -0,0 +1,153 @@
+import argparse
+import mmap
+import os
+import struct
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from tts_cache import FakeSynthesizer, GTTSSynthesizer, audio_key, split_sentences
+
+# --- Prebuilt audio packs ---
+# Most of what the tutor speaks is fixed text: scenario prompts, feedback and
+# dictionary examples. ``python audio_pack.py build PACK`` synthesizes each
+# of those strings once and stores the MP3s in one file that /api/tts serves
+# from directly (set CHATBOT_AUDIO_PACK). Rebuilding an existing pack only
+# synthesizes the strings it does not hold yet.
+#
+# Format: MAGIC, entry count (uint64), then one fixed-size index record per
+# entry sorted by key (the 32-byte tts_cache.audio_key of lang and text,
+# offset and length as uint64), then the audio. Lookups binary-search the
+# mapped index, so serving from a pack costs no synthesis and little memory.
+
+MAGIC = b"CHATAUDIO1\n"
+_COUNT = struct.Struct("<Q")
+_RECORD = struct.Struct("<32sQQ")
+
+
+def pack_key(text, lang):
+    """Binary form of the audio cache key."""
+    return bytes.fromhex(audio_key(text, lang))
+
+
+class AudioPack:
+    """Read-only, memory-mapped audio pack."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not an audio pack")
+        (self._count,) = _COUNT.unpack_from(self._mm, len(MAGIC))
+        self._index_start = len(MAGIC) + _COUNT.size
+
+    def __len__(self):
+        return self._count
+
+    def _record(self, i):
+        return _RECORD.unpack_from(self._mm, self._index_start + i * _RECORD.size)
+
+    def _find(self, key):
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = self._index_start + mid * _RECORD.size
+            if self._mm[start:start + 32] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._count:
+            record = self._record(lo)
+            if record[0] == key:
+                return record
+        return None
+
+    def get(self, text, lang="en"):
+        """MP3 bytes for ``text``, or None if it is not in the pack."""
+        record = self._find(pack_key(text, lang))
+        if record is None:
+            return None
+        _, offset, length = record
+        return self._mm[offset:offset + length]
+
+    def items(self):
+        """(key, audio) for every entry."""
+        for i in range(self._count):
+            key, offset, length = self._record(i)
+            yield key, self._mm[offset:offset + length]
+
+    def close(self):
+        self._mm.close()
+
+
+def write_pack(entries, path):
+    """Atomically write ``{key: audio}`` to ``path``; readers of the old file are unaffected."""
+    keys = sorted(entries)
+    offset = len(MAGIC) + _COUNT.size + _RECORD.size * len(keys)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(_COUNT.pack(len(keys)))
+        for key in keys:
+            f.write(_RECORD.pack(key, offset, len(entries[key])))
+            offset += len(entries[key])
+        for key in keys:
+            f.write(entries[key])
+    os.replace(tmp_path, path)
+
+
+def with_sentences(texts):
+    """``texts`` plus the sentence chunks /api/tts/stream requests for each of them."""
+    expanded = set()
+    for text in texts:
+        expanded.add(text)
+        expanded.update(split_sentences(text))
+    return sorted(expanded)
+
+
+def build_pack(texts, path, synthesizer, lang="en", workers=4):
+    """Write a pack holding ``texts`` to ``path``, reusing audio from the pack already there.
+
+    Returns (reused, synthesized, dropped) counts.
+    """
+    wanted = {pack_key(text, lang): text for text in texts if text and text.strip()}
+    entries = {}
+    dropped = 0
+    if os.path.exists(path):
+        old = AudioPack(path)
+        for key, audio in old.items():
+            if key in wanted:
+                entries[key] = audio
+            else:
+                dropped += 1
+        old.close()
+    reused = len(entries)
+    missing = [(key, text) for key, text in wanted.items() if key not in entries]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for (key, _), audio in zip(missing, pool.map(lambda item: synthesizer(item[1], lang), missing)):
+            entries[key] = audio
+    write_pack(entries, path)
+    return reused, len(missing), dropped
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build an audio pack of the tutor's fixed texts.")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("pack", help="pack file to create or update")
+    parser.add_argument("--lang", default="en")
+    parser.add_argument("--workers", type=int, default=4, help="parallel synthesizer calls")
+    parser.add_argument("--fake-delay", type=float, metavar="SECONDS",
+                        help="use the local fake synthesizer with this delay instead of gTTS")
+    args = parser.parse_args(argv)
+
+    import ai_logic
+    synthesizer = FakeSynthesizer(args.fake_delay) if args.fake_delay is not None else GTTSSynthesizer()
+    reused, synthesized, dropped = build_pack(
+        with_sentences(ai_logic.speakable_texts()), args.pack, synthesizer, lang=args.lang, workers=args.workers)
+    print(f"{args.pack}: {reused + synthesized} entries ({reused} reused, {synthesized} synthesized, "
+          f"{dropped} dropped), {os.path.getsize(args.pack)} bytes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
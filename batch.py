@@ -0,0 +1,153 @@
+import os
+import threading
+
+import ai_logic
+from dictionary_store import LayeredDictionary
+
+# --- Batch text processing ---
+
+ACTIONS = {
+    "grammar": ai_logic.advanced_grammar_fix,
+    "vocabulary": ai_logic.advanced_vocab_boost,
+    "explain": ai_logic.explain_word,
+}
+
+
+def process_item(item):
+    """Run one ``{"text": ..., "action": ...}`` item; errors are reported per item."""
+    if not isinstance(item, dict):
+        return {"error": "Invalid item."}
+    text = item.get("text")
+    action = ACTIONS.get(item.get("action"))
+    if not text or not isinstance(text, str):
+        return {"error": "No text provided."}
+    if action is None:
+        return {"error": "Invalid action."}
+    return {"result": action(text)}
+
+
+def _tables():
+    """The rule tables a worker process depends on, by name.
+
+    With a dictionary file configured only its writable overlay is listed;
+    workers map the file themselves.
+    """
+    definitions = ai_logic.DEFINITIONS
+    return {
+        "grammar": ai_logic.GRAMMAR_CORRECTIONS,
+        "vocabulary": ai_logic.VOCAB_BOOSTS,
+        "definitions": definitions.overlay if isinstance(definitions, LayeredDictionary) else definitions,
+    }
+
+
+def tables_version():
+    """Version of every rule table a worker process depends on."""
+    return tuple(table.version for table in _tables().values())
+
+
+def _dictionary_path():
+    definitions = ai_logic.DEFINITIONS
+    return definitions.base.path if isinstance(definitions, LayeredDictionary) else None
+
+
+def _replace(table, contents):
+    for key in [key for key in table if key not in contents]:
+        del table[key]
+    table.update(contents)
+
+
+# --- Worker side ---
+# Workers start from a fresh interpreter (forkserver or spawn): forking the
+# threaded server process could copy a lock held by another thread. So the
+# initializer is sent the tables as they were when the pool started, and each
+# chunk carries the tables changed since then, if any.
+
+_worker_version = None
+
+
+def _init_worker(dictionary_path, contents, version):
+    if dictionary_path:
+        ai_logic.configure_dictionary(dictionary_path)
+    _apply(contents, version)
+    ai_logic._grammar_engine._current()
+    ai_logic._vocab_matcher._current()
+
+
+def _apply(contents, version):
+    global _worker_version
+    tables = _tables()
+    for name, table_contents in contents.items():
+        _replace(tables[name], table_contents)
+    _worker_version = version
+
+
+def _process_chunk(version, changed, items):
+    if changed and version != _worker_version:
+        _apply(changed, version)
+    return [process_item(item) for item in items]
+
+
+class BatchProcessor:
+    """Processes lists of items, inline when small and on a process pool when large.
+
+    The pool is started on first use, in fresh worker processes given the
+    current rule tables. Later table changes travel with each chunk, so the
+    pool is only restarted when a different dictionary file is configured.
+    """
+
+    def __init__(self, workers=None, inline_threshold=64, chunksize=32):
+        self.workers = workers or os.cpu_count() or 1
+        self.inline_threshold = inline_threshold
+        self.chunksize = chunksize
+        self._pool = None
+        self._pool_dictionary = None
+        self._pool_versions = None  # table name -> version the workers started with
+        self._changes = None  # (tables_version(), tables changed since the pool started)
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        """The pool, plus the table version and changed tables to send with each chunk."""
+        # Imported here: multiprocessing is only needed once a batch is large enough.
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        tables = _tables()
+        version = tables_version()
+        dictionary_path = _dictionary_path()
+        with self._lock:
+            if self._pool is None or self._pool_dictionary != dictionary_path:
+                if self._pool is not None:
+                    self._pool.shutdown(wait=False)
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                context = multiprocessing.get_context(method)
+                if method == "forkserver":
+                    context.set_forkserver_preload([__name__])
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=context, initializer=_init_worker,
+                    initargs=(dictionary_path, {name: dict(table) for name, table in tables.items()}, version))
+                self._pool_dictionary = dictionary_path
+                self._pool_versions = {name: table.version for name, table in tables.items()}
+                self._changes = (version, None)
+            if self._changes[0] != version:
+                self._changes = (version, {name: dict(table) for name, table in tables.items()
+                                           if table.version != self._pool_versions[name]})
+            return self._pool, version, self._changes[1]
+
+    def warm(self):
+        """Start every worker process now instead of on the first large batch."""
+        pool, _, _ = self._get_pool()
+        list(pool.map(int, range(self.workers)))
+
+    def process(self, items):
+        """Return one result dict per item, in order."""
+        if len(items) < self.inline_threshold or self.workers < 2:
+            return [process_item(item) for item in items]
+        pool, version, changed = self._get_pool()
+        chunks = [items[i:i + self.chunksize] for i in range(0, len(items), self.chunksize)]
+        results = pool.map(_process_chunk, [version] * len(chunks), [changed] * len(chunks), chunks)
+        return [result for chunk in results for result in chunk]
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
@@ -0,0 +1,883 @@
+"""Timing benchmarks for the text, scenario, quiz and endpoint hot paths.
+
+``python benchmark.py`` runs the microbenchmark suite and prints per-call
+times, with result memoization turned off unless ``--memo`` is given. ``--save FILE`` stores them as a JSON baseline and ``--compare FILE``
+checks them against one, exiting with status 1 if any case is slower than
+the baseline by more than ``--threshold``. ``--report NAME`` runs one of the
+longer scaling/throughput reports instead. ``--import-budget MS`` only checks
+that a fresh interpreter imports the app within MS milliseconds (exit 1 if not);
+without MS the budget is read from CHATBOT_IMPORT_BUDGET_MS.
+"""
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import re
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from rule_engine import GrammarEngine, PhraseMatcher, match_case
+
+# --- Synthetic data ---
+
+WORDS = [
+    "the", "learner", "wrote", "a", "short", "essay", "about", "their", "weekend",
+    "trip", "and", "i", "is", "very", "happy", "with", "teh", "result", "they",
+    "was", "late", "because", "it", "was", "to", "cold", "outside", "today",
+]
+
+
+def make_text(n_words, seed=0):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(n_words))
+
+
+def make_grammar_rules(n_rules, seed=0):
+    """Build ``n_rules`` literal word-boundary rules, like GRAMMAR_CORRECTIONS."""
+    from ai_logic import GRAMMAR_CORRECTIONS
+    rules = dict(GRAMMAR_CORRECTIONS)
+    rng = random.Random(seed)
+    while len(rules) < n_rules:
+        word = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(4, 9)))
+        rules[r"\b" + word + r"\b"] = word[::-1]
+    return rules
+
+
+def make_vocab_boosts(n_phrases, seed=0):
+    """Build ``n_phrases`` one- and two-word boosts on top of VOCAB_BOOSTS."""
+    from ai_logic import VOCAB_BOOSTS
+    boosts = dict(VOCAB_BOOSTS)
+    rng = random.Random(seed)
+    while len(boosts) < n_phrases:
+        word = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(4, 9)))
+        phrase = word if rng.random() < 0.5 else rng.choice(WORDS) + " " + word
+        boosts[phrase] = word.upper()
+    return boosts
+
+
+def _sequential_fix(text, rules):
+    """The old approach: one re.sub over the whole text per rule."""
+    for pattern, fix in rules.items():
+        text = re.sub(pattern, lambda m: match_case(fix, m.group(0)), text, flags=re.IGNORECASE)
+    return text
+
+
+def timeit(func, *args, repeat=5):
+    """Return the best wall-clock time of ``repeat`` runs, in milliseconds."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def measure(func, min_time=0.2, repeat=5):
+    """Return the best per-call time of ``func()`` in milliseconds.
+
+    The number of calls per round is calibrated so that ``repeat`` rounds
+    together take about ``min_time`` seconds.
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed * repeat >= min_time or number >= 1 << 20:
+            break
+        number *= 2 if elapsed == 0 else max(2, min(10, int(min_time / repeat / elapsed) + 1))
+    best = elapsed
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, time.perf_counter() - start)
+    return best / number * 1000
+
+
+# --- Microbenchmark suite ---
+# Each case is a name and a zero-argument callable; names are stable so that
+# results can be compared across runs.
+
+TEXT_SIZES = {"chat": 12, "paragraph": 150, "essay": 1500, "multipage": 10000}
+TABLE_SIZES = (40, 1000, 10000)
+SCENARIO_WALKS = {
+    "coffee_shop": ["start", "A latte please", "medium", "no thanks", "card"],
+    "job_interview": ["start", "I am a teacher", "patience", "public speaking", "no questions"],
+    "weekend_trip": ["start", "something cultural", "a museum", "street food", "train"],
+}
+
+
+def _scenario_walk(scenario_id, messages):
+    import ai_logic
+
+    def walk():
+        for message in messages:
+            ai_logic.scenario_chatbot_response(message, scenario_id, "bench-walk")
+    return walk
+
+
+def suite_cases(quick=False):
+    """Yield (name, callable) for every case in the suite."""
+    import ai_logic
+    import quiz_logic
+    import app
+
+    sizes = {k: v for k, v in TEXT_SIZES.items() if not quick or v <= 1500}
+    texts = {name: make_text(n) for name, n in sizes.items()}
+
+    for name, text in texts.items():
+        yield f"grammar/default/{name}", lambda text=text: ai_logic.advanced_grammar_fix(text)
+        yield f"vocab/default/{name}", lambda text=text: ai_logic.advanced_vocab_boost(text)
+    for n_rules in TABLE_SIZES[:2] if quick else TABLE_SIZES:
+        engine = GrammarEngine(make_grammar_rules(n_rules))
+        matcher = PhraseMatcher(make_vocab_boosts(n_rules))
+        engine.compile()
+        matcher.compile()
+        for name in ("chat", "essay"):
+            if name in texts:
+                yield f"grammar/rules{n_rules}/{name}", lambda e=engine, t=texts[name]: e.apply(t)
+                yield f"vocab/phrases{n_rules}/{name}", lambda m=matcher, t=texts[name]: m.apply(t)
+
+    # A keystroke in the last sentence of an essay, against the previous revision.
+    from incremental import IncrementalChecker
+    checker = IncrementalChecker(ai_logic.advanced_grammar_fix)
+    essay = ". ".join(make_text(15, seed=i) for i in range(100)) + "."
+    base = checker.check(essay)["revision"]
+    edits = iter(range(1 << 30))
+    yield "grammar/incremental/essay-edit", lambda: checker.check(essay + f" word{next(edits)}", base)
+    yield "grammar/full/essay-edit", lambda: ai_logic.advanced_grammar_fix(essay + f" word{next(edits)}")
+
+    yield "explain/hit", lambda: ai_logic.explain_word("Serendipity")
+    yield "explain/miss", lambda: ai_logic.explain_word("serendipty")
+
+    for scenario_id, messages in SCENARIO_WALKS.items():
+        yield f"scenario/walk/{scenario_id}", _scenario_walk(scenario_id, messages)
+
+    yield "quiz/get", quiz_logic.get_quiz_question
+    yield "quiz/check", lambda: quiz_logic.check_quiz_answer("q12", "were")
+
+    client = app.app.test_client()
+    paragraph = texts["paragraph"]
+    yield "http/page/grammar", lambda: client.get("/")
+    page_etag = client.get("/").headers["ETag"]
+    yield "http/page/grammar-304", lambda: client.get("/", headers={"If-None-Match": page_etag})
+    css_url = app.static_assets.url("css/style.css")
+    yield "http/asset/css-gzip", lambda: client.get(f"/assets/{css_url}", headers={"Accept-Encoding": "gzip"})
+    yield "http/define", lambda: client.get("/api/define/nuance")
+    yield "http/process/grammar", lambda: client.post("/api/process", json={"text": paragraph, "action": "grammar"})
+    yield "http/process/vocabulary", lambda: client.post("/api/process", json={"text": paragraph, "action": "vocabulary"})
+    yield "http/process/explain", lambda: client.post("/api/process", json={"text": "nuance", "action": "explain"})
+
+    def chat_walk():
+        for message in SCENARIO_WALKS["coffee_shop"]:
+            client.post("/api/chat", json={"message": message, "scenario": "coffee_shop"})
+    yield "http/chat/walk", chat_walk
+    yield "http/quiz/new", lambda: client.get("/api/quiz/new")
+    yield "http/quiz/check", lambda: client.post("/api/quiz/check", json={"question_id": "q3", "answer": "lay"})
+
+
+def run_suite(pattern="*", quick=False):
+    """Run the matching suite cases and return ``{name: ms per call}``."""
+    results = {}
+    min_time = 0.05 if quick else 0.2
+    for name, func in suite_cases(quick):
+        if not fnmatch.fnmatch(name, pattern):
+            continue
+        results[name] = measure(func, min_time=min_time)
+        print(f"{name:<36} {results[name]:>12.4f} ms")
+    return results
+
+
+def save_baseline(results, path):
+    baseline = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+
+
+def compare_to_baseline(results, path, threshold):
+    """Print the change per case and return the names slower than allowed."""
+    with open(path) as f:
+        baseline = json.load(f)["results"]
+    regressions = []
+    print(f"\nCompared with {path} (threshold +{threshold:.0%}):")
+    for name, ms in results.items():
+        old = baseline.get(name)
+        if old is None:
+            print(f"{name:<36} {'new':>12}")
+            continue
+        change = (ms - old) / old if old else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:<36} {change:>+11.1%}{flag}")
+    return regressions
+
+
+# --- Reports ---
+
+def bench_grammar_engine(rule_counts=(40, 500, 2000, 10000), text_sizes=(20, 500, 5000)):
+    print("Grammar correction: sequential re.sub vs compiled single pass (ms)")
+    print(f"{'rules':>7} {'words':>7} {'sequential':>12} {'compiled':>10}")
+    for n_rules in rule_counts:
+        rules = make_grammar_rules(n_rules)
+        engine = GrammarEngine(rules)
+        engine.compile()
+        for n_words in text_sizes:
+            text = make_text(n_words)
+            # Re-running the sequential version at 10k rules is slow, one run is enough.
+            seq = timeit(_sequential_fix, text, rules, repeat=1 if n_rules > 1000 else 3)
+            comp = timeit(engine.apply, text)
+            print(f"{n_rules:>7} {n_words:>7} {seq:>12.2f} {comp:>10.2f}")
+
+
+CASE_SAMPLES = [
+    "i has a apple", "I HAS A APPLE", "They Was late", "WE WAS there", "Teh end", "tEh EnD",
+    "\u0130 is happy", "\u0130 has a pen", "\u017feperate rooms", "we \u017fhould of gone",
+    "it was to cold", "Could Of, Would Of", "caf\u00e9 untill na\u00efve", "\u00c9t\u00e9 wich teh",
+]
+
+
+def bench_grammar_equivalence():
+    """Check the compiled engine against the sequential re.sub loop on mixed-case and non-ASCII text."""
+    from ai_logic import GRAMMAR_CORRECTIONS
+    engine = GrammarEngine(GRAMMAR_CORRECTIONS)
+    for text in CASE_SAMPLES:
+        expected = _sequential_fix(text, GRAMMAR_CORRECTIONS)
+        got = engine.apply(text)
+        if got != expected:
+            raise AssertionError(f"engine gave {got!r} for {text!r}, sequential rules give {expected!r}")
+    print(f"Grammar engine matches the sequential rules on {len(CASE_SAMPLES)} mixed-case and non-ASCII inputs")
+
+
+def bench_vocab_matcher(phrase_counts=(40, 500, 2000, 10000), text_sizes=(20, 500, 5000)):
+    print("Vocabulary boost: token trie, including lazy rebuild after a table change (ms)")
+    print(f"{'phrases':>7} {'words':>7} {'rebuild':>10} {'apply':>10}")
+    for n_phrases in phrase_counts:
+        matcher = PhraseMatcher(make_vocab_boosts(n_phrases))
+        rebuild = timeit(matcher.compile)
+        for n_words in text_sizes:
+            text = make_text(n_words)
+            print(f"{n_phrases:>7} {n_words:>7} {rebuild:>10.2f} {timeit(matcher.apply, text):>10.2f}")
+
+
+COFFEE_WALK = [("", None), ("I'd like a {drink}", "{drink}"), ("{size} please", "{size} {drink}"),
+               ("no thanks", "$5.75"), ("card", "Great job!")]
+
+
+def _walk_coffee_shop(index):
+    """Walk one coffee-shop session and check every reply belongs to it."""
+    import ai_logic
+    session_id = f"bench-{index}"
+    slots = {"drink": ("latte", "cappuccino", "coffee", "tea")[index % 4],
+             "size": ("small", "medium", "large")[index % 3]}
+    for message, expected in COFFEE_WALK:
+        reply = ai_logic.scenario_chatbot_response(message.format(**slots) or "start", "coffee_shop", session_id)
+        if expected and expected.format(**slots) not in reply:
+            raise AssertionError(f"session {session_id} got a reply for someone else: {reply!r}")
+
+
+def bench_sessions(n_sessions=500, workers=64):
+    """Run many scenario sessions at once against each session backend."""
+    import ai_logic
+    from session_store import MemoryBackend, SQLiteBackend
+    print(f"Concurrent tutor sessions: {n_sessions} coffee-shop walks on {workers} threads")
+    original = ai_logic.session_store
+    with tempfile.TemporaryDirectory() as tmp:
+        backends = [("memory", MemoryBackend()), ("sqlite", SQLiteBackend(os.path.join(tmp, "sessions.db")))]
+        try:
+            for name, backend in backends:
+                ai_logic.configure_session_store(backend)
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    list(pool.map(_walk_coffee_shop, range(n_sessions)))
+                elapsed = (time.perf_counter() - start) * 1000
+                print(f"{name:>8}: {elapsed:.1f} ms total, {len(backend)} sessions stored, all replies consistent")
+        finally:
+            ai_logic.configure_session_store(original)
+
+
+def bench_batch(n_items=2000, words=200):
+    """Compare one HTTP request per item with the batch endpoint."""
+    import app
+    client = app.app.test_client()
+    actions = ["grammar", "vocabulary", "explain"]
+    items = [{"text": make_text(words, seed=i) if i % 3 != 2 else "resilience", "action": actions[i % 3]}
+             for i in range(n_items)]
+    print(f"Batch processing: {n_items} items of ~{words} words (ms)")
+
+    start = time.perf_counter()
+    for item in items:
+        client.post("/api/process", json=item)
+    per_item = (time.perf_counter() - start) * 1000
+    print(f"{'per-item requests':>22}: {per_item:10.1f}")
+
+    for label, threshold in (("batch, inline", n_items + 1), ("batch, process pool", 1)):
+        app.batch_processor.inline_threshold = threshold
+        if threshold == 1:
+            app.batch_processor.warm()
+        elapsed = timeit(lambda: client.post("/api/process/batch", json={"items": items}), repeat=3)
+        print(f"{label:>22}: {elapsed:10.1f}")
+    app.batch_processor.shutdown()
+
+
+def bench_fuzzy(sizes=(1000, 10000, 100000), queries=2000):
+    """Build time and per-query latency of the did-you-mean index."""
+    from fuzzy import FuzzyIndex
+    print("Fuzzy suggestions: symmetric-delete index over synthetic headwords")
+    print(f"{'words':>7} {'build s':>9} {'query ms':>9}")
+    rng = random.Random(0)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    for n_words in sizes:
+        words = set()
+        while len(words) < n_words:
+            words.add("".join(rng.choice(letters) for _ in range(rng.randint(4, 12))))
+        table = dict.fromkeys(words)
+        index = FuzzyIndex(table)
+        start = time.perf_counter()
+        index.rebuild()
+        build = time.perf_counter() - start
+        samples = rng.sample(sorted(words), min(queries, n_words))
+        typos = [w[:i] + w[i + 1:] for w in samples for i in [rng.randrange(len(w))]]
+        start = time.perf_counter()
+        for typo in typos:
+            index.suggest(typo)
+        query = (time.perf_counter() - start) * 1000 / len(typos)
+        print(f"{n_words:>7} {build:>9.2f} {query:>9.3f}")
+
+
+_DICTIONARY_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+from fuzzy import FuzzyIndex, LayeredFuzzyIndex
+if sys.argv[1] == "dict":
+    with open(sys.argv[2], encoding="utf-8") as f:
+        table = json.load(f)
+    index = FuzzyIndex(table)
+else:
+    from dictionary_store import MappedDictionary, MappedFuzzyIndex
+    table = MappedDictionary(sys.argv[2])
+    index = LayeredFuzzyIndex(table, FuzzyIndex({}), MappedFuzzyIndex(sys.argv[2] + ".fuzzy", table))
+loaded = time.perf_counter() - start
+words = sys.argv[3].split(",")
+start = time.perf_counter()
+for word in words:
+    table.get(word)
+cold = time.perf_counter() - start
+start = time.perf_counter()
+for word in words:
+    table.get(word)
+hot = time.perf_counter() - start
+
+
+def rss():
+    with open("/proc/self/status") as f:
+        status = dict(line.split(":", 1) for line in f)
+    return [int(status[key].split()[0]) for key in ("RssAnon", "RssFile")]
+
+
+lookup_rss = rss()
+misspelled = [word[:2] + word[3:] for word in words[:100]]  # a first misspelled lookup builds the index
+start = time.perf_counter()
+for word in misspelled:
+    index.suggest(word)
+suggest = time.perf_counter() - start
+print(json.dumps([loaded, cold / len(words), hot / len(words)] + lookup_rss
+                 + [suggest / len(misspelled)] + rss()))
+"""
+
+
+def bench_dictionary(sizes=(10000, 100000, 500000), lookups=1000):
+    """Startup time, resident memory and lookup latency: in-memory dict vs. dictionary file."""
+    import subprocess
+    from dictionary_store import build_dictionary_file
+    print("Definitions: JSON loaded into a dict vs. memory-mapped dictionary file (fresh process each)")
+    print("file MB is page cache shared by every worker mapping the same file; "
+          "the last three columns are after 100 did-you-mean lookups")
+    print(f"{'words':>7} {'store':>6} {'load ms':>9} {'cold us':>9} {'hot us':>8} {'anon MB':>8} {'file MB':>8} "
+          f"{'sugg us':>8} {'anon MB':>8} {'file MB':>8}")
+    rng = random.Random(0)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_words in sizes:
+            entries = {}
+            while len(entries) < n_words:
+                word = "".join(rng.choice(letters) for _ in range(rng.randint(4, 12)))
+                entries[word] = {"def": f"A made-up meaning of {word} for benchmarking.",
+                                 "ex": f"She used the word {word} in a sentence."}
+            json_path = os.path.join(tmp, f"{n_words}.json")
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+            dict_path = os.path.join(tmp, f"{n_words}.dict")
+            build_dictionary_file(entries.items(), dict_path)
+            probe = ",".join(rng.sample(sorted(entries), min(lookups, n_words)))
+            for store, path in (("dict", json_path), ("mmap", dict_path)):
+                out = subprocess.run([sys.executable, "-c", _DICTIONARY_PROBE, store, path, probe],
+                                     capture_output=True, text=True, check=True,
+                                     cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+                loaded, cold, hot, anon, mapped, suggest, suggest_anon, suggest_mapped = json.loads(out)
+                print(f"{n_words:>7} {store:>6} {loaded * 1000:>9.1f} {cold * 1e6:>9.1f} {hot * 1e6:>8.1f} "
+                      f"{anon / 1024:>8.1f} {mapped / 1024:>8.1f} {suggest * 1e6:>8.1f} "
+                      f"{suggest_anon / 1024:>8.1f} {suggest_mapped / 1024:>8.1f}")
+
+
+def bench_tts_load(delay=0.5, tts_requests=40, cheap_requests=40, stream_requests=8, server_threads=8):
+    """Latency of /api/process while a burst of uncached TTS and TTS stream requests arrives.
+
+    Requests are served by a fixed set of ``server_threads``, as in a threaded
+    worker, so TTS calls that hold a thread delay everything queued behind them.
+    With the pool, the report fails (AssertionError) unless the overflow is
+    rejected with 503 and Retry-After on both TTS endpoints, no stream waits
+    much longer than the timeout for its first segment, a synthesis that
+    outlasts the timeout is answered with 503, and /api/process p95 stays
+    below one synthesis.
+    """
+    import app
+    from tts_cache import AudioCache, FakeSynthesizer, SpeechStreamer, SynthesisPool
+    print(f"TTS backpressure: {tts_requests} TTS + {stream_requests} TTS stream + {cheap_requests} /api/process "
+          f"requests on {server_threads} server threads, fake synthesizer {delay * 1000:.0f} ms")
+    print(f"{'mode':>22} {'p50 ms':>8} {'p95 ms':>8} {'tts 200':>8} {'tts 503':>8} {'str 200':>8} {'str 503':>8} "
+          f"{'first s':>8}")
+    client = app.app.test_client()
+    original = app.tts_cache, app.tts_streamer
+    timeout = 5
+    modes = [("inline synthesis", None), ("pool 2 + queue 4", SynthesisPool(workers=2, max_queue=4))]
+    try:
+        for label, pool in modes:
+            app.tts_cache = AudioCache(FakeSynthesizer(delay), pool=pool, timeout=timeout if pool else None)
+            app.tts_streamer = SpeechStreamer(app.tts_cache)
+            latencies = []
+            responses = []
+            streams = []  # (status, Retry-After, seconds until the first segment or the 503)
+
+            def tts(i):
+                response = client.post("/api/tts", json={"text": f"sentence {label} {i}"})
+                responses.append((response.status_code, response.headers.get("Retry-After")))
+                response.close()
+
+            def stream(i):
+                text = " ".join(f"Stream {label} {i} sentence {n}." for n in range(6))
+                start = time.perf_counter()
+                response = client.post("/api/tts/stream", json={"text": text})
+                streams.append((response.status_code, response.headers.get("Retry-After"),
+                                time.perf_counter() - start))
+                response.get_data()
+                response.close()
+
+            def cheap(submitted):
+                client.post("/api/process", json={"text": "i has a apple", "action": "grammar"})
+                latencies.append((time.perf_counter() - submitted) * 1000)
+
+            with ThreadPoolExecutor(max_workers=server_threads) as server:
+                for i in range(max(tts_requests, cheap_requests)):
+                    if i < tts_requests:
+                        server.submit(tts, i)
+                    if i < cheap_requests:
+                        server.submit(cheap, time.perf_counter())
+                    if i < stream_requests:
+                        server.submit(stream, i)
+            latencies.sort()
+            p50 = latencies[len(latencies) // 2]
+            p95 = latencies[int(len(latencies) * 0.95) - 1]
+            statuses = [status for status, _ in responses]
+            stream_statuses = [status for status, _, _ in streams]
+            first = max(seconds for _, _, seconds in streams)
+            print(f"{label:>22} {p50:>8.1f} {p95:>8.1f} {statuses.count(200):>8} {statuses.count(503):>8} "
+                  f"{stream_statuses.count(200):>8} {stream_statuses.count(503):>8} {first:>8.1f}")
+            if pool is None:
+                continue
+            if 503 not in statuses:
+                raise AssertionError(f"{label}: a saturated pool answered no TTS request with 503")
+            if any(status == 503 and not retry_after for status, retry_after, *_ in responses + streams):
+                raise AssertionError(f"{label}: a 503 from a saturated pool had no Retry-After")
+            if any(status not in (200, 503) for status in stream_statuses):
+                raise AssertionError(f"{label}: TTS streams answered {sorted(set(stream_statuses))}")
+            if first > timeout + delay:
+                raise AssertionError(f"{label}: a TTS stream waited {first:.1f} s for its first segment, "
+                                     f"past the {timeout} s timeout")
+            if p95 > delay * 1000:
+                raise AssertionError(f"{label}: /api/process p95 {p95:.0f} ms is over one synthesis "
+                                     f"({delay * 1000:.0f} ms)")
+
+        # Long streams already holding the pool must not make a new stream wait past the timeout.
+        app.tts_cache = AudioCache(FakeSynthesizer(delay), pool=SynthesisPool(workers=2, max_queue=8),
+                                   timeout=2 * delay)
+        app.tts_streamer = SpeechStreamer(app.tts_cache)
+        long_text = " ".join(f"Long stream sentence {n}." for n in range(12))
+        with ThreadPoolExecutor(max_workers=3) as server:
+            for i in range(3):
+                server.submit(lambda i=i: client.post("/api/tts/stream", json={"text": f"{i}. {long_text}"}).get_data())
+            time.sleep(delay / 2)
+            start = time.perf_counter()
+            response = client.post("/api/tts/stream", json={"text": "A short text. Read aloud."})
+            first = time.perf_counter() - start
+            response.close()
+        print(f"{'3 long streams':>22} short stream {response.status_code} after {first:.1f} s")
+        if first > 2 * delay + delay / 2:
+            raise AssertionError(f"a short stream behind long ones waited {first:.1f} s, past the "
+                                 f"{2 * delay:.1f} s timeout")
+
+        # A synthesis slower than the wait limit must not hold the request.
+        app.tts_cache = AudioCache(FakeSynthesizer(delay), pool=SynthesisPool(workers=1, max_queue=4),
+                                   timeout=delay / 5)
+        app.tts_streamer = SpeechStreamer(app.tts_cache)
+        for path in ("/api/tts", "/api/tts/stream"):
+            response = client.post(path, json={"text": f"A sentence for {path} slower than the timeout."})
+            response.close()
+            print(f"{'timeout ' + str(delay / 5) + ' s':>22} {path} {response.status_code}, "
+                  f"Retry-After {response.headers.get('Retry-After')}")
+            if response.status_code != 503 or not response.headers.get("Retry-After"):
+                raise AssertionError(f"{path}: a synthesis past the timeout gave {response.status_code}, "
+                                     f"not 503 with Retry-After")
+    finally:
+        app.tts_cache, app.tts_streamer = original
+
+
+class _OneLaneCache:
+    """An AudioCache whose fetches all share one lane, as before fetched-ahead chunks were deferred."""
+
+    def __init__(self, cache):
+        self._cache = cache
+
+    def fetch(self, text, lang="en", background=False):
+        return self._cache.fetch(text, lang)
+
+    def __getattr__(self, name):
+        return getattr(self._cache, name)
+
+
+def bench_tts_stream(concurrency=(1, 2, 4, 8), sentences=8, delay=0.2, workers=4):
+    """Time to first audio for concurrent TTS streams, and for a short one arriving behind them."""
+    from tts_cache import AudioCache, FakeSynthesizer, SpeechStreamer, SynthesisPool
+    print(f"TTS streams: {sentences}-sentence texts at once, then a 2-sentence text; "
+          f"{workers} synthesis threads, fake synthesizer {delay * 1000:.0f} ms")
+    print(f"{'streams':>7} {'scheduling':>24} {'first p50 s':>12} {'first max s':>12} {'short first s':>14}")
+    modes = [("one lane, prefetch " + str(workers), lambda cache: SpeechStreamer(_OneLaneCache(cache), workers)),
+             ("lanes, prefetch 2", lambda cache: SpeechStreamer(cache))]
+    for n_streams in concurrency:
+        for label, make_streamer in modes:
+            cache = AudioCache(FakeSynthesizer(delay), pool=SynthesisPool(workers=workers, max_queue=256))
+            streamer = make_streamer(cache)
+
+            def first_audio(text):
+                start = time.perf_counter()
+                chunks = streamer.stream(text)
+                next(chunks)
+                first = time.perf_counter() - start
+                for _ in chunks:
+                    pass
+                return first
+
+            with ThreadPoolExecutor(max_workers=n_streams + 1) as clients:
+                texts = [" ".join(f"Stream {label} {i} part {n}." for n in range(sentences)) for i in range(n_streams)]
+                futures = [clients.submit(first_audio, text) for text in texts]
+                time.sleep(delay / 2)
+                short = clients.submit(first_audio, f"A short {label} text. Read aloud.").result()
+                firsts = sorted(future.result() for future in futures)
+            print(f"{n_streams:>7} {label:>24} {firsts[len(firsts) // 2]:>12.2f} {firsts[-1]:>12.2f} {short:>14.2f}")
+
+
+def bench_document_stream(sizes_mb=(1, 4)):
+    """Peak memory and time: whole-string processing vs. the streaming pipeline."""
+    import io
+    import tracemalloc
+    import ai_logic
+    from document_stream import read_text, sentence_blocks
+    print("Large documents: grammar + vocabulary, whole string vs. streamed sentence blocks")
+    print(f"{'MB':>4} {'mode':>7} {'seconds':>8} {'peak MB':>8}")
+    sentence = make_text(60, seed=7) + ". "
+    for size in sizes_mb:
+        data = (sentence * (size * 1024 * 1024 // len(sentence))).encode("utf-8")
+        runs = [
+            ("whole", lambda: ai_logic.advanced_vocab_boost(
+                ai_logic.advanced_grammar_fix(io.BytesIO(data).read().decode("utf-8")))),
+            ("stream", lambda: sum(len(piece) for piece in ai_logic.process_document_stream(
+                sentence_blocks(read_text(io.BytesIO(data))), ["grammar", "vocabulary"]))),
+        ]
+        for mode, run in runs:
+            tracemalloc.start()
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{size:>4} {mode:>7} {elapsed:>8.2f} {peak / 1024 / 1024:>8.1f}")
+
+
+def bench_quiz_scheduler(learners=200000, bank_sizes=(20, 10000, 100000), draws=5):
+    """Memory per learner and time per draw/answer of the quiz scheduler, by bank size."""
+    import tracemalloc
+    from quiz_scheduler import QuizScheduler
+    print(f"Quiz scheduler: {learners} learners x {draws} draws")
+    print(f"{'bank':>7} {'us/draw':>8} {'B/learner':>10} {'total MB':>9}")
+    for bank_size in bank_sizes:
+        rng = random.Random(0)
+        scheduler = QuizScheduler(bank_size, max_learners=learners, rng=rng)
+        tracemalloc.start()
+        start = time.perf_counter()
+        for learner in range(learners):
+            for _ in range(draws):
+                position = scheduler.next_position(learner)
+                scheduler.record(learner, position, rng.random() < 0.7)
+        elapsed = time.perf_counter() - start
+        used = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"{bank_size:>7} {elapsed * 1e6 / (learners * draws):>8.1f} {used / learners:>10.0f} "
+              f"{used / 1024 / 1024:>9.1f}")
+        del scheduler
+
+
+_IMPORT_PROBE = "import time; start = time.perf_counter(); import app; print(time.perf_counter() - start)"
+
+
+def _run_fresh(args, env=None):
+    import subprocess
+    return subprocess.run([sys.executable] + args, capture_output=True, text=True, check=True,
+                          cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+
+
+def measure_import(runs=5, cached_audio=20000):
+    """Median seconds to import the app in a fresh interpreter.
+
+    The TTS cache directory holds ``cached_audio`` files, as on a server that
+    has been running a while, so startup work that grows with it shows up.
+    """
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for i in range(cached_audio):
+            with open(os.path.join(cache_dir, f"{i:064x}.mp3"), "wb") as f:
+                f.write(b"FAKE-MP3")
+        env = dict(os.environ, CHATBOT_TTS_CACHE_DIR=cache_dir)
+        times = sorted(float(_run_fresh(["-c", _IMPORT_PROBE], env).stdout) for _ in range(runs))
+    return times[len(times) // 2]
+
+
+def bench_startup(top=15):
+    """Where app import time goes, from ``python -X importtime``."""
+    stderr = _run_fresh(["-X", "importtime", "-c", "import app"]).stderr
+    by_package = {}
+    own = []
+    project = {os.path.splitext(name)[0] for name in os.listdir(os.path.dirname(os.path.abspath(__file__)))
+               if name.endswith(".py")}
+    for line in stderr.splitlines():
+        m = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)", line)
+        if not m:
+            continue
+        self_us, cumulative_us, name = int(m.group(1)), int(m.group(2)), m.group(4)
+        package = name.split(".")[0]
+        by_package[package] = by_package.get(package, 0) + self_us
+        if package in project:
+            own.append((cumulative_us, self_us, name))
+    total = sum(by_package.values())
+    print(f"App import: {measure_import() * 1000:.1f} ms wall (median of 5 fresh interpreters, "
+          f"20000 files in the TTS cache)")
+    print(f"\nSelf time by top-level package ({total / 1000:.1f} ms in total, includes interpreter startup):")
+    for package, us in sorted(by_package.items(), key=lambda item: -item[1])[:top]:
+        print(f"{package:>28} {us / 1000:>8.1f} ms")
+    print("\nProject modules (cumulative / self):")
+    for cumulative_us, self_us, name in sorted(own, reverse=True):
+        print(f"{name:>28} {cumulative_us / 1000:>8.1f} ms {self_us / 1000:>8.1f} ms")
+
+
+def bench_audio_pack(n_texts=10000, changed=100):
+    """Full and incremental pack builds, and lookups against the pack."""
+    from audio_pack import AudioPack, build_pack
+    from tts_cache import FakeSynthesizer
+    print(f"Audio pack: {n_texts} texts, fake synthesizer, then {changed} texts changed")
+    texts = [make_text(12, seed=i) for i in range(n_texts)]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "audio.pack")
+        for label, batch in (("full build", texts), ("incremental", texts[changed:] + [t + " again" for t in texts[:changed]])):
+            synthesizer = FakeSynthesizer()
+            start = time.perf_counter()
+            reused, synthesized, dropped = build_pack(batch, path, synthesizer)
+            elapsed = time.perf_counter() - start
+            print(f"{label:>12}: {elapsed * 1000:8.1f} ms, {synthesized} synthesized, {reused} reused, {dropped} dropped")
+        pack = AudioPack(path)
+        probes = texts[changed:changed + 1000]
+        start = time.perf_counter()
+        for text in probes:
+            pack.get(text)
+        print(f"{'lookup':>12}: {(time.perf_counter() - start) * 1e6 / len(probes):8.1f} us per hit, "
+              f"{os.path.getsize(path) / 1024:.0f} KB pack")
+        pack.close()
+
+
+def bench_event_log(recorded=200000, aggregated=2000000):
+    """Cost of recording an event versus a JSON line, and aggregating a large log."""
+    import event_log
+    rng = random.Random(0)
+    questions = [f"q{i}" for i in range(1, 21)]
+    steps = ["start", "size", "extra", "payment", "end"]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "events.log")
+        recorder = event_log.EventRecorder(path)
+        start = time.perf_counter()
+        for i in range(recorded):
+            recorder.record(event_log.QUIZ_ANSWER, i & 1, questions[i % 20], actor=f"learner{i % 1000}")
+        binary = time.perf_counter() - start
+        recorder.flush()
+        start = time.perf_counter()
+        with open(os.path.join(tmp, "events.jsonl"), "a") as f:
+            for i in range(recorded):
+                f.write(json.dumps({"t": time.time(), "question": questions[i % 20], "correct": bool(i & 1),
+                                    "learner": f"learner{i % 1000}"}) + "\n")
+                f.flush()
+        lines = time.perf_counter() - start
+        print(f"Recording {recorded} quiz answers: {binary * 1e6 / recorded:.2f} us per event "
+              f"({recorder.dropped} dropped), JSON line per event: {lines * 1e6 / recorded:.2f} us")
+
+        now = time.time()
+        data = bytearray()
+        for i in range(aggregated):
+            if i % 2:
+                data += event_log.RECORD.pack(now + i * 1e-3, event_log.QUIZ_ANSWER, rng.random() < 0.7,
+                                              i % 5000, event_log.intern(questions[i % 20]), 0, 0)
+            else:
+                k = rng.randrange(4)
+                data += event_log.RECORD.pack(now + i * 1e-3, event_log.SCENARIO_STEP, event_log.ADVANCED,
+                                              i % 5000, event_log.intern("coffee_shop"),
+                                              event_log.intern(steps[k]), event_log.intern(steps[k + 1]))
+        with open(path, "wb") as f:
+            f.write(data)
+        start = time.perf_counter()
+        result = event_log.aggregate(path)
+        elapsed = time.perf_counter() - start
+        print(f"Aggregating {result['events']} events ({len(data) / 1024 / 1024:.0f} MB): {elapsed:.2f} s, "
+              f"{elapsed * 1e9 / result['events']:.0f} ns per event")
+
+
+def bench_profiling(calls=200000):
+    """Per-request cost of the profiling hooks when a request is not picked, and when it is."""
+    import ai_logic
+    from profiling import RequestProfiler
+    with tempfile.TemporaryDirectory() as tmp:
+        profiler = RequestProfiler(tmp, sample_rate=0.001, token="secret")
+        headers = {"Content-Type": "application/json"}
+        start = time.perf_counter()
+        for _ in range(calls):
+            profile = profiler.start(headers)
+            if profile is not None:
+                profile.disable()
+                profiler._busy.release()
+        print(f"Unsampled decision: {(time.perf_counter() - start) * 1e6 / calls:.2f} us per request")
+        text = make_text(1500)
+        plain = measure(lambda: ai_logic.advanced_grammar_fix(text))
+        start = time.perf_counter()
+        profile = profiler.start({"X-Chatbot-Profile": "secret"})
+        ai_logic.advanced_grammar_fix(text)
+        name = profiler.finish(profile, "process_text", time.perf_counter() - start, len(text))
+        profiled = (time.perf_counter() - start) * 1000
+        print(f"1500-word grammar fix: {plain:.2f} ms plain, {profiled:.2f} ms profiled and dumped ({name})")
+
+
+def bench_locales(requests=2000):
+    """Cost of loading a locale pack on first use, and of a request once it is resident."""
+    import ai_logic
+    import memo
+    memo.set_enabled(False)
+    codes = ai_logic.locale_packs.available()
+    samples = {"es": "yo es estudiante y fuistes a el mercado, fue muy bueno",
+               "fr": "je va à le marché et je ai faim, c'est très bon"}
+    print(f"Locale packs: {', '.join(codes)}")
+    for code in codes:
+        ai_logic.configure_locales()
+        text = samples.get(code, "hello")
+        start = time.perf_counter()
+        pack = ai_logic.locale_pack(code)
+        pack.grammar_fix(text)
+        pack.vocab_boost(text)
+        cold = (time.perf_counter() - start) * 1000
+        warm = measure(lambda: (pack.grammar_fix(text), pack.vocab_boost(text)))
+        print(f"{code:>4}: first request (load + compile) {cold:6.2f} ms, then {warm * 1000:6.1f} us per request")
+    ai_logic.configure_locales(max_resident=1)
+    start = time.perf_counter()
+    for i in range(requests):
+        ai_logic.locale_pack(codes[i % len(codes)]).grammar_fix("yo es")
+    elapsed = time.perf_counter() - start
+    print(f"Alternating locales with room for one pack: {elapsed * 1e3 / requests:.2f} ms per request "
+          f"({ai_logic.locale_packs.loads} loads)")
+    memo.set_enabled(True)
+
+
+REPORTS = {
+    "audio-pack": bench_audio_pack,
+    "event-log": bench_event_log,
+    "dictionary": bench_dictionary,
+    "document-stream": bench_document_stream,
+    "fuzzy": bench_fuzzy,
+    "grammar-equivalence": bench_grammar_equivalence,
+    "grammar-scaling": bench_grammar_engine,
+    "locales": bench_locales,
+    "profiling": bench_profiling,
+    "vocab-scaling": bench_vocab_matcher,
+    "quiz-scheduler": bench_quiz_scheduler,
+    "sessions": bench_sessions,
+    "startup": bench_startup,
+    "batch": bench_batch,
+    "tts-load": bench_tts_load,
+    "tts-stream": bench_tts_stream,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", default="*", help="run only suite cases matching this glob, e.g. 'grammar/*'")
+    parser.add_argument("--quick", action="store_true", help="skip the largest inputs and time each case briefly")
+    parser.add_argument("--save", metavar="FILE", help="write the results to FILE as a JSON baseline")
+    parser.add_argument("--compare", metavar="FILE", help="compare the results with a saved baseline")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed slowdown before a case counts as a regression (default 0.2 = 20%%)")
+    parser.add_argument("--report", choices=sorted(REPORTS), help="run a longer report instead of the suite")
+    parser.add_argument("--memo", action="store_true",
+                        help="leave result memoization on (off by default so repeated inputs are really timed)")
+    parser.add_argument("--import-budget", type=float, metavar="MS", nargs="?", const=-1.0,
+                        help="only check that importing the app takes at most MS milliseconds; exit 1 if not "
+                             "(with no MS: $CHATBOT_IMPORT_BUDGET_MS)")
+    args = parser.parse_args(argv)
+
+    if args.import_budget == -1.0:
+        try:
+            args.import_budget = float(os.environ["CHATBOT_IMPORT_BUDGET_MS"])
+        except (KeyError, ValueError):
+            parser.error("--import-budget needs MS or a numeric CHATBOT_IMPORT_BUDGET_MS")
+    if args.import_budget is not None:
+        elapsed = measure_import() * 1000
+        print(f"app import: {elapsed:.1f} ms (budget {args.import_budget:.0f} ms)")
+        if elapsed > args.import_budget:
+            print("import-time budget exceeded; see 'python benchmark.py --report startup'")
+            return 1
+        return 0
+
+    import memo
+    memo.set_enabled(args.memo)
+
+    if args.report:
+        REPORTS[args.report]()
+        return 0
+
+    results = run_suite(args.only, quick=args.quick)
+    status = 0
+    if args.compare:
+        regressions = compare_to_baseline(results, args.compare, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            status = 1
+    if args.save:
+        save_baseline(results, args.save)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,237 @@
+import json
+import mmap
+import struct
+import sys
+import zlib
+from array import array
+from bisect import bisect_left
+
+from fuzzy import _deletes
+from memo import LRUCache
+
+# --- File format ---
+# MAGIC, entry count (uint64), then one uint64 offset per entry, then the
+# entries sorted by UTF-8 headword. Each entry is the headword, a NUL byte and
+# a JSON array [definition, example]. Lookups binary-search the offsets, so
+# only the pages touched are read, and every worker process mapping the same
+# file shares them through the OS page cache.
+#
+# Build one with ``python dictionary_store.py build INPUT OUTPUT``, where INPUT
+# is JSON ({"word": {"def": ..., "ex": ...}}) or JSONL (one
+# {"word": ..., "def": ..., "ex": ...} object per line).
+#
+# The build also writes the "did you mean" index as a sidecar, OUTPUT.fuzzy:
+# FUZZY_MAGIC, a header (pair count, entry count, max distance, prefix
+# length), then sorted uint64 pairs of (crc32 of a delete << 32 | entry
+# index), the same symmetric deletes fuzzy.FuzzyIndex keeps in a dict. A
+# query binary-searches each of its deletes, so suggestions over a large
+# dictionary cost no memory beyond the pages they touch. A crc32 collision
+# only adds a candidate, which the edit-distance check then rejects.
+
+USAGE = "usage: python dictionary_store.py build INPUT(.json|.jsonl) OUTPUT"
+MAGIC = b"CHATDICT1\n"
+_COUNT = struct.Struct("<Q")
+FUZZY_MAGIC = b"CHATFUZZ1\n"
+_FUZZY_HEADER = struct.Struct("<QQBB4x")
+
+
+def build_dictionary_file(entries, path):
+    """Write ``{word: {"def": ..., "ex": ...}}`` items to a dictionary file."""
+    records = sorted(
+        (word.lower().encode("utf-8"), json.dumps([info.get("def", ""), info.get("ex", "")]).encode("utf-8"))
+        for word, info in entries
+    )
+    header_size = len(MAGIC) + _COUNT.size * (len(records) + 1)
+    offsets = []
+    position = header_size
+    for key, payload in records:
+        offsets.append(position)
+        position += len(key) + 1 + len(payload)
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(_COUNT.pack(len(records)))
+        f.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+        for key, payload in records:
+            f.write(key + b"\0" + payload)
+    build_fuzzy_file([key for key, _ in records], path + ".fuzzy")
+
+
+def build_fuzzy_file(keys, path, max_distance=2, prefix_length=7):
+    """Write the delete index for the sorted headwords ``keys`` (UTF-8 bytes)."""
+    # Bucketed by the top byte of the hash, so only one bucket is sorted as a
+    # list at a time; the rest wait in compact arrays.
+    buckets = [array("Q") for _ in range(256)]
+    for index, key in enumerate(keys):
+        hashes = {zlib.crc32(d.encode("utf-8")) for d in _deletes(key.decode("utf-8")[:prefix_length], max_distance)}
+        for h in hashes:
+            buckets[h >> 24].append(h << 32 | index)
+    with open(path, "wb") as f:
+        f.write(FUZZY_MAGIC)
+        f.write(_FUZZY_HEADER.pack(sum(map(len, buckets)), len(keys), max_distance, prefix_length))
+        for i, bucket in enumerate(buckets):
+            f.write(array("Q", sorted(bucket)).tobytes())
+            buckets[i] = None
+
+
+class MappedDictionary:
+    """Read-only mapping of headword -> {"def", "ex"} backed by a dictionary file.
+
+    Opening the file costs nothing beyond mapping it; entries are decoded on
+    demand and the most recently used ones are kept in a small LRU.
+    """
+
+    def __init__(self, path, cache_size=2048):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a dictionary file")
+        start = len(MAGIC)
+        (self._count,) = _COUNT.unpack_from(self._mm, start)
+        start += _COUNT.size
+        self._offsets = memoryview(self._mm)[start:start + 8 * self._count].cast("Q")
+        self._cache = LRUCache(cache_size)
+
+    def _key_at(self, index):
+        offset = self._offsets[index]
+        return self._mm[offset:self._mm.find(b"\0", offset)]
+
+    def _entry_at(self, index):
+        offset = self._offsets[index]
+        split = self._mm.find(b"\0", offset)
+        end = self._offsets[index + 1] if index + 1 < self._count else len(self._mm)
+        definition, example = json.loads(self._mm[split + 1:end])
+        return {"def": definition, "ex": example}
+
+    def _find(self, key):
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._count and self._key_at(lo) == key:
+            return lo
+        return None
+
+    def get(self, word, default=None):
+        entry = self._cache.get(word, _ABSENT)
+        if entry is _ABSENT:
+            index = self._find(word.encode("utf-8"))
+            entry = None if index is None else self._entry_at(index)
+            self._cache.set(word, entry)
+        return default if entry is None else entry
+
+    def __getitem__(self, word):
+        entry = self.get(word)
+        if entry is None:
+            raise KeyError(word)
+        return entry
+
+    def __contains__(self, word):
+        return self.get(word) is not None
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for index in range(self._count):
+            yield self._key_at(index).decode("utf-8")
+
+
+_ABSENT = object()
+
+
+class MappedFuzzyIndex:
+    """Spelling candidates for a MappedDictionary, read from its ``.fuzzy`` sidecar.
+
+    Provides ``candidates(word)`` for fuzzy.LayeredFuzzyIndex, which does the
+    ranking.
+    """
+
+    def __init__(self, path, dictionary):
+        self.path = path
+        self.dictionary = dictionary
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(FUZZY_MAGIC)] != FUZZY_MAGIC:
+            raise ValueError(f"{path} is not a fuzzy index file")
+        count, entries, self.max_distance, self.prefix_length = _FUZZY_HEADER.unpack_from(self._mm, len(FUZZY_MAGIC))
+        if entries != len(dictionary):
+            raise ValueError(f"{path} does not match {dictionary.path}; rebuild the dictionary")
+        start = len(FUZZY_MAGIC) + _FUZZY_HEADER.size
+        self._pairs = memoryview(self._mm)[start:start + 8 * count].cast("Q")
+
+    def candidates(self, word):
+        pairs = self._pairs
+        n = len(pairs)
+        indexes = set()
+        for d in _deletes(word[:self.prefix_length], self.max_distance):
+            h = zlib.crc32(d.encode("utf-8"))
+            i = bisect_left(pairs, h << 32)
+            while i < n and pairs[i] >> 32 == h:
+                indexes.add(pairs[i] & 0xFFFFFFFF)
+                i += 1
+        key_at = self.dictionary._key_at
+        return {key_at(index).decode("utf-8") for index in indexes}
+
+
+class LayeredDictionary:
+    """A read-only base dictionary with a writable overlay on top.
+
+    Reads check the overlay first. Writes go to the overlay, which is a
+    VersionedDict, so ``version`` changes whenever a definition is added.
+    """
+
+    def __init__(self, base, overlay):
+        self.base = base
+        self.overlay = overlay
+
+    @property
+    def version(self):
+        return self.overlay.version
+
+    def get(self, word, default=None):
+        entry = self.overlay.get(word)
+        if entry is None:
+            entry = self.base.get(word)
+        return default if entry is None else entry
+
+    def __getitem__(self, word):
+        entry = self.get(word)
+        if entry is None:
+            raise KeyError(word)
+        return entry
+
+    def __setitem__(self, word, entry):
+        self.overlay[word] = entry
+
+    def __contains__(self, word):
+        return word in self.overlay or word in self.base
+
+    def __iter__(self):
+        yield from self.overlay
+        for word in self.base:
+            if word not in self.overlay:
+                yield word
+
+    def __len__(self):
+        return len(self.base) + sum(1 for word in self.overlay if word not in self.base)
+
+
+def _read_entries(path):
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    yield record["word"], record
+        else:
+            yield from json.load(f).items()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "build":
+        sys.exit(USAGE)
+    build_dictionary_file(_read_entries(sys.argv[2]), sys.argv[3])
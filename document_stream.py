@@ -0,0 +1,55 @@
+import codecs
+import re
+
+# --- Streaming large documents ---
+# Whole books are processed as a stream of sentence-aligned blocks instead of
+# one string: the text is read in chunks and cut only right after sentence
+# punctuation, so no rule match can span two blocks (grammar rules work
+# within a sentence, and vocabulary phrases never cross punctuation). Memory
+# stays around one block regardless of document size.
+
+_BOUNDARY = re.compile(r"[.!?]\s+")
+_SPACE = re.compile(r"\s+")
+
+
+def read_text(stream, chunk_size=64 * 1024, encoding="utf-8"):
+    """Yield decoded text from a binary ``stream`` ``chunk_size`` bytes at a time."""
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    while True:
+        data = stream.read(chunk_size)
+        if not data:
+            break
+        text = decoder.decode(data)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def _last_cut(buffer, start, pattern):
+    cut = None
+    for m in pattern.finditer(buffer, start):
+        cut = m.end()
+    return cut
+
+
+def sentence_blocks(chunks, block_size=64 * 1024):
+    """Regroup text ``chunks`` into blocks of about ``block_size`` that end at a sentence.
+
+    A block with no sentence end in four times ``block_size`` is cut at the
+    last whitespace instead, and one with no whitespace at all is cut anywhere.
+    """
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= block_size:
+            cut = _last_cut(buffer, block_size // 2, _BOUNDARY) or _last_cut(buffer, 0, _BOUNDARY)
+            if cut is None:
+                if len(buffer) < 4 * block_size:
+                    break  # wait for more text
+                cut = _last_cut(buffer, 0, _SPACE) or len(buffer)
+            yield buffer[:cut]
+            buffer = buffer[cut:]
+    if buffer:
+        yield buffer
@@ -0,0 +1,316 @@
+import argparse
+import atexit
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from collections import Counter as Tally
+from functools import lru_cache
+
+from metrics import Counter
+
+# --- Learning analytics events ---
+# Quiz answers and tutor scenario steps are recorded as fixed-width binary
+# records, so recording costs one struct.pack_into into a preallocated ring
+# buffer. A background thread appends the buffer to the log file in bulk
+# about once a second; if it falls a whole buffer behind, the oldest events
+# are dropped (and counted) rather than blocking requests.
+#
+# Question, scenario and step ids are interned as 64-bit hashes of their
+# names, so every process (gunicorn worker) agrees on them without
+# coordination and can append to the same file, and two names sharing an id
+# (a chance of about 3 in 10^8 among a million names) need not be checked for.
+# The names are kept in a sidecar file (PATH.names). Learners are only
+# counted, never named, so their ids are the low 32 bits of the hash. Enable
+# with CHATBOT_EVENT_LOG=PATH, and read the statistics with
+# ``python event_log.py stats PATH``.
+#
+# Record: time (float64), kind, outcome (uint8), actor (uint32), subject,
+# step, next step (uint64): 40 bytes, with every field naturally aligned.
+
+RECORD = struct.Struct("<dBB2xIQQQ")
+
+QUIZ_ANSWER = 1  # subject = question, outcome = correct
+SCENARIO_STEP = 2  # subject = scenario, step = the learner's step, outcome below
+
+# Scenario outcomes
+STARTED = 0  # the learner entered ``step`` as the scenario's first step
+ADVANCED = 1  # moved from ``step`` to ``next``
+RETRIED = 2  # the message did not match, so the learner stayed on ``step``
+COMPLETED = 3  # the scenario ended at ``step``
+
+
+@lru_cache(maxsize=65536)
+def intern(name):
+    """Stable 64-bit id for ``name``; 0 is reserved for "none"."""
+    if not name:
+        return 0
+    return int.from_bytes(hashlib.blake2b(name.encode("utf-8"), digest_size=8).digest(), "little") or 1
+
+
+class EventRecorder:
+    """Buffers event records in memory and appends them to ``path`` in the background."""
+
+    def __init__(self, path, capacity=65536, flush_interval=1.0):
+        self.path = path
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self._buffer = bytearray(capacity * RECORD.size)
+        self._written = 0  # records ever put in the buffer
+        self._flushed = 0  # records ever taken out of it
+        self.dropped = 0
+        self._names = {}  # id -> name, not yet written to the names file
+        self._known = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        atexit.register(self.flush)
+
+    def _id(self, name):
+        ident = intern(name)
+        if ident and ident not in self._known:
+            self._known.add(ident)
+            self._names[ident] = name
+        return ident
+
+    def record(self, kind, outcome, subject, step=None, next_step=None, actor=None):
+        """Append one event; costs a few microseconds and never blocks on I/O."""
+        now = time.time()
+        with self._lock:
+            # After a fork the flusher thread stays behind in the parent.
+            if self._pid != os.getpid():
+                self._start()
+            RECORD.pack_into(self._buffer, (self._written % self.capacity) * RECORD.size,
+                             now, kind, outcome, intern(actor) & 0xFFFFFFFF,  # learners are counted, not named
+                             self._id(subject), self._id(step), self._id(next_step))
+            self._written += 1
+            if self._written - self._flushed > self.capacity:
+                self._flushed += 1
+                self.dropped += 1
+            if self._written - self._flushed >= self.capacity // 2:
+                self._wake.set()
+
+    def _start(self):
+        self._pid = os.getpid()
+        self._written = self._flushed = 0
+        self._thread = threading.Thread(target=self._run, name="event-log", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Event log error: {e}")
+
+    def _take(self):
+        """Copy the unflushed records (and new names) out of the buffer."""
+        with self._lock:
+            start, end = self._flushed % self.capacity, self._written % self.capacity
+            count = self._written - self._flushed
+            if count == 0:
+                data = b""
+            elif start < end:
+                data = bytes(self._buffer[start * RECORD.size:end * RECORD.size])
+            else:
+                data = bytes(self._buffer[start * RECORD.size:]) + bytes(self._buffer[:end * RECORD.size])
+            self._flushed = self._written
+            names, self._names = self._names, {}
+        return data, names
+
+    def flush(self):
+        """Write out everything recorded so far."""
+        data, names = self._take()
+        # Names first, so the log never refers to an id the names file lacks.
+        if names:
+            with open(self.path + ".names", "a", encoding="utf-8") as f:
+                f.write("".join(f"{ident:016x}\t{name}\n" for ident, name in names.items()))
+        if data:
+            # One O_APPEND write of whole records, so concurrent workers never interleave inside one.
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, data)
+            finally:
+                os.close(fd)
+
+    def collect(self):
+        """Event counters as metrics, for Registry.add_collector."""
+        events = Counter("chatbot_events_total", "Analytics events by fate.", ["fate"])
+        with self._lock:
+            events.inc("recorded", amount=self._written)
+            events.inc("dropped", amount=self.dropped)
+        return [events]
+
+
+# --- Module-level hooks used by the quiz and the tutor ---
+
+recorder = None
+
+
+def configure(path, capacity=65536, flush_interval=1.0):
+    """Start recording events to ``path`` (None stops recording)."""
+    global recorder
+    if recorder is not None:
+        recorder.flush()
+    recorder = EventRecorder(path, capacity, flush_interval) if path else None
+    return recorder
+
+
+def quiz_answer(question_id, correct, learner_id=None):
+    if recorder is not None:
+        recorder.record(QUIZ_ANSWER, 1 if correct else 0, question_id, actor=learner_id)
+
+
+def scenario_step(scenario_id, step_id, outcome, next_step_id=None, session_id=None):
+    if recorder is not None:
+        recorder.record(SCENARIO_STEP, outcome, scenario_id, step_id, next_step_id, session_id)
+
+
+# --- Aggregation ---
+
+def load_names(path):
+    names = {0: ""}
+    try:
+        with open(path + ".names", encoding="utf-8") as f:
+            for line in f:
+                ident, _, name = line.rstrip("\n").partition("\t")
+                names[int(ident, 16)] = name
+    except FileNotFoundError:
+        pass
+    return names
+
+
+def columns(data):
+    """Column views over whole records in ``data``: each field is a strided memoryview.
+
+    Fields are read straight from the file's bytes, and tallying zips of
+    these views runs in C without unpacking records in Python.
+    """
+    size = len(data) - len(data) % RECORD.size
+    raw = memoryview(data)[:size]
+    ids = raw.cast("Q")
+    per_record = RECORD.size // 8
+    return {
+        "time": raw.cast("d")[0::per_record],
+        "kind": raw[8::RECORD.size],
+        "outcome": raw[9::RECORD.size],
+        "actor": raw.cast("I")[3::RECORD.size // 4],
+        "subject": ids[2::per_record],
+        "step": ids[3::per_record],
+        "next": ids[4::per_record],
+    }
+
+
+def aggregate(path, since=None):
+    """Per-question accuracy and per-step scenario funnel for the log at ``path``.
+
+    ``since`` (a Unix time) limits the statistics to newer events.
+    """
+    names = load_names(path)
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < RECORD.size:
+            return {"events": 0, "questions": {}, "scenarios": {}}
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            cols = columns(mm)
+            if since is not None:
+                # Records arrive in time order, give or take a flush interval
+                # across processes, so a binary search finds the cut.
+                times = cols["time"]
+                lo, hi = 0, len(times)
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    if times[mid] < since:
+                        lo = mid + 1
+                    else:
+                        hi = mid
+                whole, cols = cols, {name: view[lo:] for name, view in cols.items()}
+                for view in whole.values():
+                    view.release()
+            result = _summarize(cols, names)
+            for view in cols.values():
+                view.release()
+    return result
+
+
+def _summarize(cols, names):
+    tally = Tally(zip(cols["kind"], cols["outcome"], cols["subject"], cols["step"], cols["next"]))
+
+    def name(ident):
+        return names.get(ident, f"{ident:016x}")
+
+    questions = {}
+    scenarios = {}
+    for (kind, outcome, subject, step, next_step), n in tally.items():
+        if kind == QUIZ_ANSWER:
+            stats = questions.setdefault(name(subject), {"answers": 0, "correct": 0})
+            stats["answers"] += n
+            stats["correct"] += n * outcome
+        elif kind == SCENARIO_STEP:
+            steps = scenarios.setdefault(name(subject), {})
+            stats = _step_stats(steps, name(step))
+            if outcome == STARTED:
+                stats["reached"] += n
+            elif outcome == ADVANCED:
+                stats["advanced"] += n
+                _step_stats(steps, name(next_step))["reached"] += n
+            elif outcome == RETRIED:
+                stats["retries"] += n
+            elif outcome == COMPLETED:
+                stats["completed"] += n
+
+    for stats in questions.values():
+        stats["accuracy"] = stats["correct"] / stats["answers"]
+    for steps in scenarios.values():
+        for stats in steps.values():
+            # Learners who got here but neither moved on nor finished (or have not yet).
+            stats["dropped"] = max(0, stats["reached"] - stats["advanced"] - stats["completed"])
+            stats["drop_off"] = stats["dropped"] / stats["reached"] if stats["reached"] else 0.0
+    return {"events": len(cols["kind"]), "questions": questions, "scenarios": scenarios}
+
+
+def _step_stats(steps, step):
+    stats = steps.get(step)
+    if stats is None:
+        stats = steps[step] = {"reached": 0, "advanced": 0, "completed": 0, "retries": 0}
+    return stats
+
+
+def format_stats(result):
+    lines = [f"{result['events']} events", "", f"{'question':24s} {'answers':>8s} {'accuracy':>9s}"]
+    for question, stats in sorted(result["questions"].items(), key=lambda item: item[1]["accuracy"]):
+        lines.append(f"{question:24s} {stats['answers']:8d} {stats['accuracy']:9.1%}")
+    for scenario, steps in sorted(result["scenarios"].items()):
+        lines += ["", f"{scenario:24s} {'reached':>8s} {'advanced':>9s} {'completed':>10s} "
+                      f"{'retries':>8s} {'drop-off':>9s}"]
+        for step, stats in sorted(steps.items(), key=lambda item: -item[1]["reached"]):
+            lines.append(f"  {step:22s} {stats['reached']:8d} {stats['advanced']:9d} {stats['completed']:10d} "
+                         f"{stats['retries']:8d} {stats['drop_off']:9.1%}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize a quiz and tutor event log.")
+    parser.add_argument("command", choices=["stats"])
+    parser.add_argument("log", help="event log written via CHATBOT_EVENT_LOG")
+    parser.add_argument("--hours", type=float, help="only events from the last N hours")
+    parser.add_argument("--json", action="store_true", help="print the statistics as JSON")
+    args = parser.parse_args(argv)
+
+    since = time.time() - args.hours * 3600 if args.hours else None
+    try:
+        result = aggregate(args.log, since)
+    except OSError as e:
+        parser.error(str(e))
+    print(json.dumps(result, indent=2) if args.json else format_stats(result))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+import threading
+
+# --- Fuzzy "did you mean" lookup ---
+# Symmetric-delete index (as in SymSpell): every headword is stored under each
+# string obtainable by deleting up to ``max_distance`` characters from its
+# first ``prefix_length`` characters. A query generates the same deletes of
+# its own prefix, so candidates are found with a handful of dict lookups and
+# only those candidates get a real edit-distance check. Indexing only a prefix
+# keeps the number of keys per word small and shared between words.
+
+
+def _deletes(word, max_distance):
+    """All strings made by deleting up to ``max_distance`` characters from ``word``."""
+    results = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        next_frontier = set()
+        for w in frontier:
+            for i in range(len(w)):
+                next_frontier.add(w[:i] + w[i + 1:])
+        results |= next_frontier
+        frontier = next_frontier
+    return results
+
+
+def edit_distance(a, b, max_distance):
+    """Optimal string alignment distance, or ``max_distance + 1`` once it is exceeded.
+
+    Only cells within ``max_distance`` of the diagonal are computed, since any
+    path leaving that band already costs more than ``max_distance``.
+    """
+    la, lb = len(a), len(b)
+    if abs(la - lb) > max_distance:
+        return max_distance + 1
+    if max_distance <= 2:
+        return _small_distance(a, b, max_distance)
+    over = max_distance + 1
+    previous2 = None
+    previous = [j if j <= max_distance else over for j in range(lb + 1)]
+    for i in range(1, la + 1):
+        current = [over] * (lb + 1)
+        if i <= max_distance:
+            current[0] = i
+        lo = max(1, i - max_distance)
+        hi = min(lb, i + max_distance)
+        ai = a[i - 1]
+        row_min = current[0]
+        for j in range(lo, hi + 1):
+            value = previous[j - 1] if ai == b[j - 1] else previous[j - 1] + 1
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            if current[j - 1] + 1 < value:
+                value = current[j - 1] + 1
+            if previous2 is not None and j > 1 and ai == b[j - 2] and a[i - 2] == b[j - 1] \
+                    and previous2[j - 2] + 1 < value:
+                value = previous2[j - 2] + 1
+            if value > over:
+                value = over
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > max_distance:
+            return over
+        previous2, previous = previous, current
+    return previous[lb] if previous[lb] <= max_distance else over
+
+
+def _small_distance(a, b, k):
+    """edit_distance for ``k`` <= 2, by trying each edit at the first mismatch.
+
+    At most 4**k branches, each mostly string comparisons done in C, which is
+    several times faster than filling even a banded table in Python.
+    """
+    if abs(len(a) - len(b)) > k:
+        return k + 1
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    if i == n:
+        return abs(len(a) - len(b))
+    if k == 0:
+        return 1
+    a, b = a[i:], b[i:]
+    a1, b1 = a[1:], b[1:]
+    swapped = len(a) > 1 and len(b) > 1 and a[0] == b[1] and a[1] == b[0]
+    # One substitution, deletion, insertion or transposition?
+    if a1 == b1 or a1 == b or a == b1 or swapped and a[2:] == b[2:]:
+        return 1
+    if k == 1:
+        return 2
+    best = k + 1
+    for x, y in ((a1, b1), (a1, b), (a, b1)) + (((a[2:], b[2:]),) if swapped else ()):
+        d = _small_distance(x, y, k - 1)
+        if d + 1 < best:
+            best = d + 1
+    return best
+
+
+class FuzzyIndex:
+    """Ranked spelling suggestions for the keys of a word table.
+
+    ``add`` indexes one new word incrementally. The index is built lazily on
+    the first lookup, and rebuilt if the table was changed some other way
+    (its ``version`` moved on without ``add`` being called).
+    """
+
+    def __init__(self, table, max_distance=2, prefix_length=7):
+        self.table = table
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self._deletes = None  # delete -> word, or set of words when shared
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _table_version(self):
+        return getattr(self.table, "version", None)
+
+    def _index_word(self, word):
+        for d in _deletes(word[:self.prefix_length], self.max_distance):
+            existing = self._deletes.get(d)
+            if existing is None:
+                self._deletes[d] = word
+            elif isinstance(existing, set):
+                existing.add(word)
+            elif existing != word:
+                self._deletes[d] = {existing, word}
+
+    def rebuild(self):
+        with self._lock:
+            self._deletes = {}
+            for word in list(self.table):
+                self._index_word(word)
+            self._version = self._table_version()
+
+    def add(self, word):
+        """Index ``word``, which has just been added to the table."""
+        with self._lock:
+            if self._deletes is None:
+                return  # not built yet; the first lookup indexes everything
+            expected = self._version + 1 if self._version is not None else None
+            self._index_word(word)
+            if self._table_version() == expected:
+                self._version = expected
+
+    def candidates(self, word):
+        """Indexed words sharing a delete with ``word`` (already lowercased)."""
+        if self._deletes is None or self._version != self._table_version():
+            self.rebuild()
+        candidates = set()
+        for d in _deletes(word[:self.prefix_length], self.max_distance):
+            found = self._deletes.get(d)
+            if found is None:
+                continue
+            if isinstance(found, set):
+                candidates.update(found)
+            else:
+                candidates.add(found)
+        return candidates
+
+    def suggest(self, word, limit=3):
+        """Return up to ``limit`` known words within ``max_distance`` edits, closest first."""
+        word = word.lower().strip()
+        if not word:
+            return []
+        return rank(word, self.candidates(word), self.table, self.max_distance, limit)
+
+
+def rank(word, candidates, table, max_distance, limit):
+    """The ``limit`` candidates still in ``table`` closest to ``word``, closest first."""
+    n = len(word)
+    ranked = []
+    bound = max_distance  # once ``limit`` words are found, only ones as close can still place
+    for candidate in candidates:
+        gap = abs(len(candidate) - n)
+        if gap > bound or candidate == word:
+            continue
+        distance = edit_distance(word, candidate, bound)
+        # Membership last: on a mapped table it costs a lookup.
+        if distance <= bound and candidate in table:
+            ranked.append((distance, gap, candidate))
+            if len(ranked) >= limit:
+                ranked.sort()
+                del ranked[limit:]
+                bound = ranked[-1][0]
+    ranked.sort()
+    return [candidate for _, _, candidate in ranked[:limit]]
+
+
+class LayeredFuzzyIndex:
+    """Suggestions from a FuzzyIndex over a small writable table plus a prebuilt index of a large base.
+
+    ``base`` needs only ``candidates(word)``; without one, suggestions come
+    from the overlay alone, so a large base never gets indexed in memory.
+    """
+
+    def __init__(self, table, overlay, base=None):
+        self.table = table  # everything suggestions may come from
+        self.overlay = overlay
+        self.base = base
+        self.max_distance = overlay.max_distance
+
+    def add(self, word):
+        self.overlay.add(word)
+
+    def rebuild(self):
+        self.overlay.rebuild()
+
+    def suggest(self, word, limit=3):
+        word = word.lower().strip()
+        if not word:
+            return []
+        candidates = self.overlay.candidates(word)
+        if self.base is not None:
+            candidates |= self.base.candidates(word)
+        return rank(word, candidates, self.table, self.max_distance, limit)
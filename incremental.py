@@ -0,0 +1,105 @@
+import hashlib
+import re
+
+from memo import LRUCache
+
+# --- Incremental, sentence-level checking ---
+# The live editor sends the whole document on every check, together with the
+# revision token it got back last time. The document is split into sentences
+# and each sentence is hashed; against the previous revision only the block
+# between the unchanged prefix and unchanged suffix is reported, and only
+# sentences never seen before are run through the rules. The client applies
+# the returned splice to its list of corrected sentences.
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def sentence_spans(text):
+    """Return (start, end) offsets of the non-blank sentences in ``text``."""
+    spans = []
+    start = 0
+    for m in _SENTENCE_END.finditer(text):
+        spans.append((start, m.start()))
+        start = m.end()
+    spans.append((start, len(text)))
+    result = []
+    for start, end in spans:
+        sentence = text[start:end]
+        stripped = sentence.strip()
+        if stripped:
+            start += len(sentence) - len(sentence.lstrip())
+            result.append((start, start + len(stripped)))
+    return result
+
+
+def _digest(data):
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=16).digest()
+
+
+class IncrementalChecker:
+    """Corrects documents sentence by sentence, reusing earlier work.
+
+    ``fix`` corrects one sentence. ``version`` is a callable returning the
+    current rule-table version, so cached corrections are never served after
+    the rules change. Revisions are kept per process; an unknown revision
+    token simply makes the whole document count as changed.
+    """
+
+    def __init__(self, fix, version=lambda: 0, cache_size=20000, max_revisions=2000):
+        self.fix = fix
+        self.version = version
+        self._corrections = LRUCache(cache_size)  # (version, sentence digest) -> corrected text
+        self._revisions = LRUCache(max_revisions)  # token -> (version, tuple of sentence digests)
+        self.sentences_fixed = 0
+
+    def _correct(self, version, digest, sentence):
+        key = (version, digest)
+        corrected = self._corrections.get(key)
+        if corrected is None:
+            corrected = self.fix(sentence)
+            self._corrections.set(key, corrected)
+            self.sentences_fixed += 1
+        return corrected
+
+    def check(self, text, revision=None):
+        """Return the splice that turns ``revision``'s corrections into ``text``'s.
+
+        The result has the new ``revision`` token, the ``sentence_count``, and
+        a ``splice`` with the ``start`` index, the number of old sentences to
+        ``delete`` and the sentences to ``insert`` there, each with its span in
+        ``text``, its original wording and its correction. ``full`` is true
+        when the revision was unknown and the client must discard what it has.
+        """
+        version = self.version()
+        spans = sentence_spans(text or "")
+        sentences = [text[start:end] for start, end in spans]
+        digests = tuple(_digest(s) for s in sentences)
+        token = hashlib.blake2b(b"".join(digests) + str(version).encode(), digest_size=12).hexdigest()
+
+        previous = self._revisions.get(revision) if revision else None
+        # After a rule change every sentence the client holds may be stale.
+        old = previous[1] if previous is not None and previous[0] == version else ()
+        prefix = 0
+        limit = min(len(old), len(digests))
+        while prefix < limit and old[prefix] == digests[prefix]:
+            prefix += 1
+        suffix = 0
+        while suffix < limit - prefix and old[-1 - suffix] == digests[-1 - suffix]:
+            suffix += 1
+
+        inserted = []
+        for i in range(prefix, len(digests) - suffix):
+            start, end = spans[i]
+            inserted.append({
+                "start": start,
+                "end": end,
+                "text": sentences[i],
+                "corrected": self._correct(version, digests[i], sentences[i]),
+            })
+        self._revisions.set(token, (version, digests))
+        return {
+            "revision": token,
+            "full": not old,
+            "sentence_count": len(digests),
+            "splice": {"start": prefix, "delete": len(old) - prefix - suffix, "insert": inserted},
+        }
@@ -0,0 +1,406 @@
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+# --- Load testing ---
+# ``python loadtest.py`` drives the app with concurrent traffic and reports
+# latency percentiles, throughput and error rate per endpoint. Traffic is
+# either a replayed request log or a synthetic mix of grammar/vocabulary
+# checks, tutor scenario walks, quiz rounds and speech requests.
+#
+# A request log is JSON lines, one request each:
+#   {"method": "POST", "path": "/api/process", "json": {"text": "...", "action": "grammar"}, "t": 0.25}
+# "body" (a string) may stand in for "json", and "t" is the offset in
+# seconds from the start of the capture; with --rate unset, requests are
+# replayed at their original pace (scaled by --speed).
+#
+# By default requests go to the app in this process through Flask's test
+# client, with gTTS replaced by the local fake synthesizer so that the run
+# needs no network. With --url they go over HTTP to a running server; start
+# it with CHATBOT_TTS_FAKE_DELAY set to keep that offline too.
+
+DEFAULT_MIX = "process=5,chat=3,quiz=2,tts=1"
+
+TEXTS = [
+    "i has a apple and he go to school every day",
+    "they was late because it was to cold outside",
+    "the learner wrote a very good essay about their weekend trip",
+    "she dont like coffee but i is very happy with teh result",
+    "we goes to the market. it are a big market. the food is very nice.",
+]
+EXPLAIN_WORDS = ["happy", "big", "good", "apple", "weekend", "sad"]
+SCENARIO_WALKS = {
+    "coffee_shop": ["start", "A latte please", "medium", "no thanks", "card"],
+    "job_interview": ["start", "I am a teacher", "patience", "public speaking", "no questions"],
+    "weekend_trip": ["start", "something cultural", "a museum", "street food", "train"],
+}
+ROUTE_PARAMETERS = [("/api/define/", "<word>"), ("/assets/", "<filename>")]
+SPOKEN = [
+    "Hello! What can I get for you today?",
+    "Great choice. What size would you like?",
+    "Could you tell me a little about yourself?",
+    "That sounds wonderful. How will you get there?",
+]
+
+
+class Stop(Exception):
+    """Raised inside a worker once the run's request or time budget is spent."""
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def endpoint_label(method, path):
+    """``"GET /api/define/happy"`` -> ``"GET /api/define/<word>"``, so each route reports once."""
+    path = path.split("?", 1)[0]
+    for prefix, placeholder in ROUTE_PARAMETERS:
+        if path.startswith(prefix):
+            path = prefix + placeholder
+            break
+    return f"{method} {path}"
+
+
+# --- Transports ---
+
+class InProcessTarget:
+    """Sends requests to the app in this process through Flask's test client."""
+
+    name = "in-process"
+
+    def __init__(self, fake_delay=0.05):
+        # The app reads these at import, so they must be set first.
+        os.environ.setdefault("CHATBOT_TTS_FAKE_DELAY", str(fake_delay))
+        os.environ.setdefault("CHATBOT_TTS_CACHE_DIR", tempfile.mkdtemp(prefix="chatbot-loadtest-"))
+        import app
+        self.app = app.app
+
+    def connect(self):
+        client = self.app.test_client()
+
+        def send(method, path, body, headers):
+            response = client.open(path, method=method, data=body, headers=headers)
+            data = response.get_data()
+            response.close()
+            return response.status_code, data
+        return send
+
+
+class HTTPTarget:
+    """Sends requests over HTTP to a running server, one keep-alive connection per worker."""
+
+    def __init__(self, url, timeout=30):
+        parts = urlsplit(url)
+        self.name = url
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip("/")
+        self.timeout = timeout
+
+    def connect(self):
+        state = {"conn": None}
+        cookies = {}
+
+        def send(method, path, body, headers):
+            headers = dict(headers)
+            if cookies:
+                headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in cookies.items())
+            for attempt in (0, 1):
+                if state["conn"] is None:
+                    state["conn"] = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+                try:
+                    state["conn"].request(method, self.prefix + path, body=body, headers=headers)
+                    response = state["conn"].getresponse()
+                    data = response.read()
+                    break
+                except (http.client.HTTPException, ConnectionError):
+                    # The server may close idle keep-alive connections; retry once on a new one.
+                    state["conn"].close()
+                    state["conn"] = None
+                    if attempt:
+                        raise
+            for header in response.msg.get_all("Set-Cookie") or ():
+                name, _, value = header.split(";", 1)[0].partition("=")
+                cookies[name.strip()] = value.strip()
+            return response.status, data
+        return send
+
+
+# --- Pacing and results ---
+
+class Pacer:
+    """Hands out request start times: ``rate`` per second, or as fast as workers go if None."""
+
+    def __init__(self, rate=None, max_requests=None, duration=None):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.max_requests = max_requests
+        self.duration = duration
+        self.issued = 0
+        self._lock = threading.Lock()
+        self.start = time.perf_counter()
+        self._next = self.start
+
+    def acquire(self, at=None):
+        """Wait for the next slot; ``at`` schedules it that many seconds after the start instead."""
+        with self._lock:
+            if self.max_requests is not None and self.issued >= self.max_requests:
+                raise Stop()
+            if at is None:
+                # A rate-limited run that falls behind catches up by at most a second's worth.
+                due = max(self._next, time.perf_counter() - (1.0 if self.interval else 0.0))
+                self._next = due + self.interval
+            else:
+                due = self.start + at
+            if self.duration is not None and due - self.start >= self.duration:
+                raise Stop()
+            self.issued += 1
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Results:
+    """Latencies and outcomes per endpoint label."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)  # 5xx responses and transport failures
+        self.busy = defaultdict(int)  # 503s, which are also counted as errors
+        self.client_errors = defaultdict(int)  # 4xx
+        self._lock = threading.Lock()
+
+    def record(self, label, seconds, status):
+        with self._lock:
+            self.latencies[label].append(seconds)
+            if status is None or status >= 500:
+                self.errors[label] += 1
+            if status == 503:
+                self.busy[label] += 1
+            elif status is not None and 400 <= status < 500:
+                self.client_errors[label] += 1
+
+    def rows(self, elapsed):
+        rows = []
+        labels = sorted(self.latencies)
+        everything = []
+        for label in labels:
+            everything.extend(self.latencies[label])
+        groups = [(label, self.latencies[label], self.errors[label], self.busy[label],
+                   self.client_errors[label]) for label in labels]
+        groups.append(("TOTAL", everything, sum(self.errors.values()), sum(self.busy.values()),
+                       sum(self.client_errors.values())))
+        for label, latencies, errors, busy, client_errors in groups:
+            ordered = sorted(latencies)
+            count = len(ordered)
+            rows.append({
+                "endpoint": label,
+                "requests": count,
+                "rps": count / elapsed if elapsed else 0.0,
+                "p50_ms": percentile(ordered, 50) * 1000,
+                "p95_ms": percentile(ordered, 95) * 1000,
+                "p99_ms": percentile(ordered, 99) * 1000,
+                "max_ms": (ordered[-1] if ordered else 0.0) * 1000,
+                "error_rate": errors / count if count else 0.0,
+                "busy": busy,
+                "4xx": client_errors,
+            })
+        return rows
+
+
+class Session:
+    """One virtual user: a connection (with its cookies) that times every request."""
+
+    def __init__(self, send, pacer, results):
+        self._send = send
+        self.pacer = pacer
+        self.results = results
+
+    def request(self, method, path, json_body=None, body=None, label=None, at=None):
+        """Send one request and return (status, parsed JSON or None)."""
+        headers = {}
+        if json_body is not None:
+            body = json.dumps(json_body)
+            headers["Content-Type"] = "application/json"
+        elif isinstance(body, str):
+            body = body.encode("utf-8")
+        self.pacer.acquire(at)
+        label = label or endpoint_label(method, path)
+        start = time.perf_counter()
+        try:
+            status, data = self._send(method, path, body, headers)
+        except Exception:
+            self.results.record(label, time.perf_counter() - start, None)
+            return None, None
+        self.results.record(label, time.perf_counter() - start, status)
+        try:
+            return status, json.loads(data)
+        except ValueError:
+            return status, None
+
+
+# --- Traffic ---
+
+def _process_flow(session, rng):
+    action = rng.choice(["grammar", "grammar", "vocabulary", "explain"])
+    text = rng.choice(EXPLAIN_WORDS) if action == "explain" else rng.choice(TEXTS)
+    session.request("POST", "/api/process", {"text": text, "action": action})
+
+
+def _chat_flow(session, rng):
+    scenario_id = rng.choice(sorted(SCENARIO_WALKS))
+    session_id = f"load-{rng.getrandbits(64):016x}"
+    for message in SCENARIO_WALKS[scenario_id]:
+        session.request("POST", "/api/chat", {"message": message, "scenario": scenario_id, "session_id": session_id})
+
+
+def _quiz_flow(session, rng):
+    status, question = session.request("GET", "/api/quiz/new")
+    if status == 200 and question and question.get("options"):
+        session.request("POST", "/api/quiz/check",
+                        {"question_id": question["question_id"], "answer": rng.choice(question["options"])})
+
+
+def _tts_flow(session, rng):
+    # A few fixed phrases (cache hits) and some fresh text (synthesis).
+    if rng.random() < 0.7:
+        text = rng.choice(SPOKEN)
+    else:
+        text = f"{rng.choice(TEXTS)} {rng.getrandbits(32)}"
+    session.request("POST", "/api/tts", {"text": text})
+
+
+FLOWS = {"process": _process_flow, "chat": _chat_flow, "quiz": _quiz_flow, "tts": _tts_flow}
+
+
+def parse_mix(spec):
+    """``"process=5,chat=3"`` -> ([flow names], [weights])."""
+    names, weights = [], []
+    for part in spec.split(","):
+        name, _, weight = part.strip().partition("=")
+        if name not in FLOWS:
+            raise ValueError(f"unknown flow {name!r}; choose from {', '.join(sorted(FLOWS))}")
+        names.append(name)
+        weights.append(float(weight or 1))
+    return names, weights
+
+
+def load_log(path):
+    """Requests from a JSON-lines log, in order; lines without a path are skipped."""
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if isinstance(record, dict) and record.get("path"):
+                records.append(record)
+    return records
+
+
+def _synthetic_worker(session, names, weights, seed):
+    rng = random.Random(seed)
+    while True:
+        FLOWS[rng.choices(names, weights)[0]](session, rng)
+
+
+def _replay_worker(session, records, timed, speed):
+    for record in records:
+        body = record.get("json")
+        at = record.get("t") / speed if timed else None
+        session.request(record.get("method", "GET").upper(), record["path"],
+                        json_body=body, body=None if body is not None else record.get("body"), at=at)
+
+
+def run(target, concurrency=8, rate=None, duration=None, requests=None, mix=DEFAULT_MIX,
+        log=None, speed=1.0, seed=0):
+    """Drive ``target`` and return (results, elapsed seconds)."""
+    if duration is None and requests is None and log is None:
+        duration = 10.0
+    pacer = Pacer(rate, requests, duration)
+    results = Results()
+    if log is not None:
+        records = log if isinstance(log, list) else load_log(log)
+        if not records:
+            raise ValueError("the log holds no requests")
+        timed = rate is None and all("t" in record for record in records)
+        # Each worker replays every concurrency-th record, keeping the log's order within it.
+        tasks = [(_replay_worker, (records[i::concurrency], timed, speed)) for i in range(concurrency)]
+    else:
+        names, weights = parse_mix(mix)
+        tasks = [(_synthetic_worker, (names, weights, seed + i)) for i in range(concurrency)]
+
+    def work(worker, args):
+        try:
+            worker(Session(target.connect(), pacer, results), *args)
+        except Stop:
+            pass
+
+    threads = [threading.Thread(target=work, args=task, daemon=True) for task in tasks]
+    pacer.start = pacer._next = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - pacer.start
+
+
+def format_report(rows, elapsed):
+    lines = [f"{'endpoint':28s} {'reqs':>7s} {'req/s':>8s} {'p50 ms':>8s} {'p95 ms':>8s} "
+             f"{'p99 ms':>8s} {'max ms':>8s} {'errors':>7s} {'503':>5s} {'4xx':>5s}"]
+    for row in rows:
+        lines.append(f"{row['endpoint']:28s} {row['requests']:7d} {row['rps']:8.1f} {row['p50_ms']:8.2f} "
+                     f"{row['p95_ms']:8.2f} {row['p99_ms']:8.2f} {row['max_ms']:8.2f} "
+                     f"{row['error_rate']:7.1%} {row['busy']:5d} {row['4xx']:5d}")
+    lines.append(f"elapsed {elapsed:.2f} s")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay or generate concurrent traffic against the chatbot.")
+    parser.add_argument("--url", help="base URL of a running server (default: the app in this process)")
+    parser.add_argument("--log", help="JSON-lines request log to replay instead of the synthetic mix")
+    parser.add_argument("--mix", default=DEFAULT_MIX,
+                        help=f"synthetic flow weights, from {', '.join(sorted(FLOWS))} (default: {DEFAULT_MIX})")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="concurrent virtual users")
+    parser.add_argument("--rate", type=float, help="requests per second across all users (default: unthrottled)")
+    parser.add_argument("--duration", type=float, help="seconds to run (default: 10, or the whole log)")
+    parser.add_argument("-n", "--requests", type=int, help="stop after this many requests")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay timed logs this many times faster")
+    parser.add_argument("--fake-delay", type=float, default=0.05, metavar="SECONDS",
+                        help="in-process only: fake synthesizer delay standing in for gTTS")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    target = HTTPTarget(args.url) if args.url else InProcessTarget(args.fake_delay)
+    try:
+        results, elapsed = run(target, args.concurrency, args.rate, args.duration, args.requests,
+                               args.mix, args.log, args.speed, args.seed)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    rows = results.rows(elapsed)
+    if args.json:
+        print(json.dumps({"target": target.name, "elapsed": elapsed, "endpoints": rows}, indent=2))
+    else:
+        print(f"target {target.name}, {args.concurrency} users"
+              + (f", {args.rate:g} req/s" if args.rate else ""))
+        print(format_report(rows, elapsed))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from metrics import Counter, Gauge
+from scenario_engine import compile_scenario
+
+# --- Locale rule packs ---
+# The English rules are built into ai_logic. Rules for other target
+# languages live in locale_data/<locale>.json and are read the first time a
+# request asks for that locale, so a worker only holds the languages its
+# learners actually use. Each pack gets its own compiled matchers and result
+# caches, and only the ``max_resident`` most recently used packs are kept.
+#
+# A pack file may hold:
+#   name         display name of the language
+#   tts_lang     language code passed to the speech synthesizer (default: the locale)
+#   grammar      {regex pattern: correction}, like ai_logic.GRAMMAR_CORRECTIONS
+#   vocabulary   {phrase: stronger phrase}, like ai_logic.VOCAB_BOOSTS
+#   definitions  {word: {"def": ..., "ex": ...}}, like ai_logic.DEFINITIONS
+#   scenarios    {scenario id: scenario}, in the scenario_engine format
+# Locales are matched exactly first and then by language ("es-MX" falls back
+# to es.json).
+
+DEFAULT_LOCALE = "en"
+_CODE = re.compile(r"^[a-z]{2,3}(?:-[a-z0-9]{2,8})*$")
+_TABLES = ("grammar", "vocabulary", "definitions", "scenarios")
+
+
+class UnknownLocale(ValueError):
+    """Raised for a malformed locale or one with no rule pack."""
+
+
+def normalize_locale(locale):
+    """``"es_MX"`` -> ``"es-mx"``; raises UnknownLocale if it is not a locale code."""
+    code = str(locale).strip().replace("_", "-").lower()
+    if not _CODE.match(code):
+        raise UnknownLocale(f"invalid locale {locale!r}")
+    return code
+
+
+def read_locale_file(path):
+    """Read and validate one pack file, failing at load time rather than mid-request."""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    for table in _TABLES:
+        if not isinstance(data.get(table, {}), dict):
+            raise ValueError(f"{path}: {table} must be an object")
+    for pattern in data.get("grammar", {}):
+        re.compile(pattern)
+    for scenario_id, scenario in data.get("scenarios", {}).items():
+        compile_scenario(scenario_id, scenario)
+    return data
+
+
+class LocaleRegistry:
+    """Loads locale packs from ``directory`` on first use, keeping the ``max_resident`` most recent.
+
+    ``load(code, data)`` turns a pack file's contents into the pack object;
+    an evicted pack's ``release()`` is called, if it has one.
+    """
+
+    def __init__(self, directory, load, max_resident=4):
+        self.directory = directory
+        self.load = load
+        self.max_resident = max_resident
+        self.loads = 0
+        self.evictions = 0
+        self._packs = OrderedDict()  # code -> pack, least recently used first
+        self._lock = threading.Lock()
+
+    def available(self):
+        """Locale codes that have a pack file."""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name[:-5] for name in os.listdir(self.directory) if name.endswith(".json"))
+
+    def _path(self, code):
+        for candidate in (code, code.split("-", 1)[0]):
+            path = os.path.join(self.directory, candidate + ".json")
+            if os.path.exists(path):
+                return candidate, path
+        raise UnknownLocale(f"no rule pack for locale {code!r}")
+
+    def get(self, locale):
+        code = normalize_locale(locale)
+        with self._lock:
+            pack = self._packs.get(code)
+            if pack is None:
+                resolved, path = self._path(code)
+                pack = self._packs.get(resolved)
+                if pack is None:
+                    pack = self.load(resolved, read_locale_file(path))
+                    self.loads += 1
+                    self._packs[resolved] = pack
+                # Both names point at one pack, so "es-mx" and "es" share its caches.
+                self._packs[code] = pack
+            self._packs.move_to_end(code)
+            self._evict()
+            return pack
+
+    def _evict(self):
+        while len(set(map(id, self._packs.values()))) > self.max_resident:
+            _, oldest = self._packs.popitem(last=False)
+            if oldest not in self._packs.values():
+                self.evictions += 1
+                release = getattr(oldest, "release", None)
+                if release is not None:
+                    release()
+
+    def resident(self):
+        """Codes of the packs currently loaded, most recently used last."""
+        with self._lock:
+            return list(self._packs)
+
+    def clear(self):
+        with self._lock:
+            packs = list(self._packs.values())
+            self._packs.clear()
+        for pack in {id(pack): pack for pack in packs}.values():
+            release = getattr(pack, "release", None)
+            if release is not None:
+                release()
+
+    def collect(self):
+        """Pack loads, evictions and residency as metrics, for Registry.add_collector."""
+        events = Counter("chatbot_locale_pack_events_total", "Locale pack loads and evictions.", ["event"])
+        resident = Gauge("chatbot_locale_packs_resident", "Locale packs currently loaded.")
+        with self._lock:
+            events.inc("load", amount=self.loads)
+            events.inc("evict", amount=self.evictions)
+            resident.set(value=len(set(map(id, self._packs.values()))))
+        return [events, resident]
@@ -0,0 +1,131 @@
+import functools
+import os
+import threading
+from collections import OrderedDict
+
+from metrics import REGISTRY, Counter
+
+# --- Bounded LRU cache ---
+
+
+class LRUCache:
+    """Thread-safe LRU mapping with hit/miss counters."""
+
+    def __init__(self, max_items):
+        self.max_items = max_items
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.get(key, default)
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._data),
+                "max_items": self.max_items,
+            }
+
+
+# --- Versioned memoization ---
+# Results are cached under (normalized input, rule-table version). Mutating
+# a VersionedDict table bumps its version, so entries computed with the old
+# rules are simply never looked up again and age out of the LRU.
+
+_MISSING = object()
+_enabled = os.environ.get("CHATBOT_MEMO", "1") != "0"
+_default_size = int(os.environ.get("CHATBOT_MEMO_SIZE", 4096))
+_memoized = {}  # name -> wrapper
+
+
+def set_enabled(enabled):
+    """Turn memoization on or off for every memoized function (e.g. for benchmarks)."""
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled():
+    return _enabled
+
+
+def memoize(version, normalize=None, max_items=None, max_input_length=2000, name=None):
+    """Cache a one-argument text function by (normalized input, ``version()``).
+
+    ``normalize`` maps inputs that are guaranteed to give the same result to
+    one key. Inputs longer than ``max_input_length`` are not cached, so a few
+    large documents cannot push out many common sentences. ``name`` (default:
+    the function's name) is what stats() and /metrics report it as.
+    """
+    def decorator(func):
+        cache = LRUCache(max_items or _default_size)
+
+        @functools.wraps(func)
+        def wrapper(text):
+            if not _enabled or not isinstance(text, str) or len(text) > max_input_length:
+                return func(text)
+            key = (normalize(text) if normalize else text, version())
+            result = cache.get(key, _MISSING)
+            if result is _MISSING:
+                result = func(text)
+                cache.set(key, result)
+            return result
+
+        wrapper.cache = cache
+        _memoized[name or func.__name__] = wrapper
+        return wrapper
+    return decorator
+
+
+def stats():
+    """Hit-rate statistics of every memoized function, by name."""
+    return {name: wrapper.cache.stats() for name, wrapper in _memoized.items()}
+
+
+def forget(name):
+    """Stop reporting the memoized function ``name`` (e.g. when it is discarded)."""
+    _memoized.pop(name, None)
+
+
+def clear():
+    for wrapper in _memoized.values():
+        wrapper.cache.clear()
+
+
+def _collect():
+    lookups = Counter("chatbot_memo_lookups_total", "Memoized function lookups by outcome.", ["function", "outcome"])
+    for name, s in stats().items():
+        lookups.inc(name, "hit", amount=s["hits"])
+        lookups.inc(name, "miss", amount=s["misses"])
+    return [lookups]
+
+
+REGISTRY.add_collector(_collect)
@@ -0,0 +1,103 @@
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import random
+import re
+import threading
+import time
+
+# --- On-demand request profiling ---
+# With CHATBOT_PROFILE_DIR set, a request is run under cProfile when it
+# carries the header X-Chatbot-Profile with the value of
+# CHATBOT_PROFILE_TOKEN, or at random with probability CHATBOT_PROFILE_RATE.
+# Each profile is dumped to the directory under a name that records when it
+# was taken, the endpoint, the latency and the request body size; only the
+# newest CHATBOT_PROFILE_KEEP files are kept. /api/profiles lists the slowest
+# of them to requests carrying the token; without a token it is not served.
+# Requests that are not picked pay one header lookup and one random() call;
+# with no directory configured the hooks are not installed.
+#
+# Only one profiler can run per process, so a request picked while another
+# is being profiled simply runs unprofiled.
+
+HEADER = "X-Chatbot-Profile"
+_NAME = re.compile(r"^(?P<time>\d+)-(?P<pid>\d+)-(?P<endpoint>[\w.]+)-(?P<ms>\d+)ms-(?P<bytes>\d+)b\.prof$")
+
+
+class RequestProfiler:
+    """Decides which requests to profile and keeps their dumps in ``directory``."""
+
+    def __init__(self, directory, sample_rate=0.0, token=None, keep=200):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.token = token
+        self.keep = keep
+        self._busy = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def authorized(self, headers):
+        """True if ``headers`` carry the profiling token."""
+        value = headers.get(HEADER)
+        return bool(value and self.token and hmac.compare_digest(value, self.token))
+
+    def start(self, headers):
+        """A running profiler if this request was picked, else None."""
+        if not (self.sample_rate and random.random() < self.sample_rate) and not (
+                self.token and self.authorized(headers)):
+            return None
+        if not self._busy.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:  # another profiling tool (a debugger, say) is active
+            self._busy.release()
+            return None
+        return profile
+
+    def finish(self, profile, endpoint, seconds, input_bytes):
+        """Stop ``profile``, write it out and return the file name."""
+        profile.disable()
+        self._busy.release()
+        name = f"{int(time.time() * 1000)}-{os.getpid()}-{endpoint}-{int(seconds * 1000)}ms-{input_bytes}b.prof"
+        profile.dump_stats(os.path.join(self.directory, name))
+        self._rotate()
+        return name
+
+    def _rotate(self):
+        names = sorted(name for name in os.listdir(self.directory) if _NAME.match(name))
+        for name in names[:max(0, len(names) - self.keep)]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:  # another worker got there first
+                pass
+
+    def index(self, limit=20):
+        """The ``limit`` slowest profiles on disk, slowest first."""
+        profiles = []
+        for name in os.listdir(self.directory):
+            m = _NAME.match(name)
+            if m:
+                profiles.append({
+                    "name": name,
+                    "endpoint": m.group("endpoint"),
+                    "latency_ms": int(m.group("ms")),
+                    "input_bytes": int(m.group("bytes")),
+                    "taken_at": int(m.group("time")) / 1000,
+                    "pid": int(m.group("pid")),
+                })
+        profiles.sort(key=lambda p: -p["latency_ms"])
+        return profiles[:limit]
+
+    def summary(self, name, sort="cumulative", lines=40):
+        """Text report of the profile ``name``, or None if there is no such profile."""
+        if not _NAME.match(name):
+            return None
+        path = os.path.join(self.directory, name)
+        if not os.path.exists(path):
+            return None
+        out = io.StringIO()
+        pstats.Stats(path, stream=out).sort_stats(sort).print_stats(lines)
+        return out.getvalue()
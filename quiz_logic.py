@@ -1,4 +1,15 @@
+import json
+import mmap
+import os
 import random
+import re
+import sqlite3
+import threading
+from array import array
+from functools import lru_cache
+
+import event_log
+from quiz_scheduler import QuizScheduler
 
 # --- Quiz Data Store ---
 # All questions for the quiz are stored here.
@@ -231,32 +242,277 @@ QUIZ_DATA = [
     }
 ]
 
+# --- Quiz Banks ---
+# A bank answers three questions: how many questions it holds, the record for
+# a question id (or None), and the serialized API payload for a random
+# question. Payloads are the JSON sent by /api/quiz/new and are prepared ahead
+# of time so the hot path does not rebuild a dict per request.
+# For the per-learner scheduler, questions can also be addressed by position:
+# ``positions()`` is the number of positions, ``position(question_id)`` maps
+# an id to one and ``payload_at(position)`` returns its payload (or None).
+
+
+def _payload(record):
+    return json.dumps({
+        "question_id": record["id"],
+        "question": record["question"],
+        "options": record["options"]
+    }).encode("utf-8")
+
+
+class MemoryQuizBank:
+    """Questions held in memory, indexed by id. Used for QUIZ_DATA."""
+
+    def __init__(self, questions):
+        self._by_id = {q["id"]: q for q in questions}
+        self._positions = {q["id"]: i for i, q in enumerate(questions)}
+        self._payloads = [_payload(q) for q in questions]
+
+    def __len__(self):
+        return len(self._payloads)
+
+    def get(self, question_id):
+        return self._by_id.get(question_id)
+
+    def positions(self):
+        return len(self._payloads)
+
+    def position(self, question_id):
+        return self._positions.get(question_id)
+
+    def payload_at(self, position):
+        return self._payloads[position]
+
+    def random_payload(self):
+        return random.choice(self._payloads) if self._payloads else None
+
+
+class JSONLQuizBank:
+    """Questions read on demand from a memory-mapped JSONL file (one question per line).
+
+    The first lookup scans the file once to index line offsets by id; records
+    are parsed only when asked for, and file pages are shared between worker
+    processes through the OS page cache.
+    """
+
+    # Start of every non-empty line and the first "id" value on it.
+    _LINE_ID = re.compile(rb'^(?=[^\n]*?"id"\s*:\s*"([^"\\\n]*)")', re.MULTILINE)
+
+    def __init__(self, path, cache_size=1024):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) else b""
+        self._offsets = None
+        self._index = None
+        self._lock = threading.Lock()
+        self._read = lru_cache(maxsize=cache_size)(self._read_line)
+
+    def _ensure_index(self):
+        if self._offsets is not None:
+            return
+        with self._lock:
+            if self._offsets is not None:
+                return
+            # One regex pass over the mapped file; ids must not contain escapes.
+            offsets = array("q")
+            index = {}
+            for m in self._LINE_ID.finditer(self._mm):
+                index[m.group(1).decode("utf-8")] = len(offsets)
+                offsets.append(m.start())
+            self._index = index
+            self._offsets = offsets
+
+    def _read_line(self, position):
+        offset = self._offsets[position]
+        end = self._mm.find(b"\n", offset)
+        record = json.loads(self._mm[offset:end if end != -1 else len(self._mm)])
+        return record, _payload(record)
+
+    def __len__(self):
+        self._ensure_index()
+        return len(self._offsets)
+
+    def get(self, question_id):
+        self._ensure_index()
+        position = self._index.get(question_id)
+        return None if position is None else self._read(position)[0]
+
+    def random_payload(self):
+        self._ensure_index()
+        if not self._offsets:
+            return None
+        return self._read(random.randrange(len(self._offsets)))[1]
+
+    def positions(self):
+        return len(self)
+
+    def position(self, question_id):
+        self._ensure_index()
+        return self._index.get(question_id)
+
+    def payload_at(self, position):
+        self._ensure_index()
+        return self._read(position)[1]
+
+
+class SQLiteQuizBank:
+    """Questions stored in SQLite, with payloads serialized at build time.
+
+    Nothing is loaded up front; lookups use the primary key and random draws
+    pick a rowid, so memory does not grow with the size of the bank.
+    Create the file with ``build_sqlite_bank``.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._count, self._max_rowid = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(MAX(rowid), 0) FROM questions"
+        ).fetchone()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            # Connections must not be shared with a forked child.
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def __len__(self):
+        return self._count
+
+    def get(self, question_id):
+        row = self._connect().execute(
+            "SELECT id, question, options, answer FROM questions WHERE id = ?", (question_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"id": row[0], "question": row[1], "options": json.loads(row[2]), "answer": row[3]}
+
+    def random_payload(self):
+        if not self._count:
+            return None
+        conn = self._connect()
+        # rowids are dense when built by build_sqlite_bank; the >= handles gaps.
+        row = conn.execute(
+            "SELECT payload FROM questions WHERE rowid >= ? ORDER BY rowid LIMIT 1",
+            (random.randint(1, self._max_rowid),),
+        ).fetchone()
+        return None if row is None else row[0]
+
+    # Positions are rowid - 1; a gap in the rowids is a position with no question.
+
+    def positions(self):
+        return self._max_rowid
+
+    def position(self, question_id):
+        row = self._connect().execute("SELECT rowid FROM questions WHERE id = ?", (question_id,)).fetchone()
+        return None if row is None else row[0] - 1
+
+    def payload_at(self, position):
+        row = self._connect().execute("SELECT payload FROM questions WHERE rowid = ?", (position + 1,)).fetchone()
+        return None if row is None else row[0]
+
+
+def build_sqlite_bank(questions, path):
+    """Write an iterable of question dicts to a SQLite bank at ``path``."""
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("DROP TABLE IF EXISTS questions")
+        conn.execute(
+            "CREATE TABLE questions (id TEXT PRIMARY KEY, question TEXT NOT NULL, "
+            "options TEXT NOT NULL, answer TEXT NOT NULL, payload BLOB NOT NULL)"
+        )
+        conn.executemany(
+            "INSERT INTO questions (id, question, options, answer, payload) VALUES (?, ?, ?, ?, ?)",
+            ((q["id"], q["question"], json.dumps(q["options"]), q["answer"], _payload(q)) for q in questions),
+        )
+    conn.close()
+
+
+def load_quiz_bank(path):
+    """Open a quiz bank file, choosing the format from its extension."""
+    if path.endswith((".db", ".sqlite", ".sqlite3")):
+        return SQLiteQuizBank(path)
+    return JSONLQuizBank(path)
+
+
+# The bank used by the quiz functions; QUIZ_DATA unless configured otherwise.
+quiz_bank = MemoryQuizBank(QUIZ_DATA)
+
+# Per-learner decks and review schedules over quiz_bank; created on first use.
+quiz_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def configure_quiz_bank(bank):
+    """Replace the bank the quiz functions draw from (learner schedules start over)."""
+    global quiz_bank, quiz_scheduler
+    quiz_bank = bank
+    quiz_scheduler = None
+
+
+def _scheduler():
+    global quiz_scheduler
+    with _scheduler_lock:
+        if quiz_scheduler is None:
+            quiz_scheduler = QuizScheduler(quiz_bank.positions())
+        return quiz_scheduler
+
+
+def warm_quiz_bank():
+    """Build the quiz bank's lookup index now rather than on the first request."""
+    ensure_index = getattr(quiz_bank, "_ensure_index", None)
+    if ensure_index is not None:
+        ensure_index()
+
+
 # --- Quiz Logic Functions ---
 
-def get_quiz_question():
+def get_quiz_question_json(learner_id=None):
     """
-    Selects a random question from the list.
+    Returns a question as the serialized JSON payload for /api/quiz/new.
+    With a ``learner_id`` the learner's scheduler picks it (no repeats, missed
+    questions come back); otherwise it is drawn at random.
     We send the 'id' to the frontend to check the answer later.
     """
-    question_data = random.choice(QUIZ_DATA)
-    return {
-        "question_id": question_data["id"],
-        "question": question_data["question"],
-        "options": question_data["options"]
-    }
+    if learner_id is not None:
+        scheduler = _scheduler()
+        for _ in range(8):  # positions can be empty in a SQLite bank with gaps
+            position = scheduler.next_position(learner_id)
+            if position is None:
+                break
+            payload = quiz_bank.payload_at(position)
+            if payload is not None:
+                return payload
+    return quiz_bank.random_payload()
 
-def check_quiz_answer(question_id, user_answer):
+def get_quiz_question(learner_id=None):
     """
-    Checks if the user's answer is correct for the given question ID.
+    Selects a question from the bank (see get_quiz_question_json).
+    We send the 'id' to the frontend to check the answer later.
     """
-    for question_data in QUIZ_DATA:
-        if question_data["id"] == question_id:
-            is_correct = (user_answer == question_data["answer"])
-            return {
-                "is_correct": is_correct,
-                "correct_answer": question_data["answer"]
-            }
+    payload = get_quiz_question_json(learner_id)
+    return None if payload is None else json.loads(payload)
+
+def check_quiz_answer(question_id, user_answer, learner_id=None):
+    """
+    Checks if the user's answer is correct for the given question ID,
+    and with a ``learner_id`` schedules the question for review if it was missed.
+    """
+    question_data = quiz_bank.get(question_id)
+    if question_data is not None:
+        is_correct = (user_answer == question_data["answer"])
+        event_log.quiz_answer(question_id, is_correct, learner_id)
+        if learner_id is not None:
+            position = quiz_bank.position(question_id)
+            if position is not None:
+                _scheduler().record(learner_id, position, is_correct)
+        return {
+            "is_correct": is_correct,
+            "correct_answer": question_data["answer"]
+        }
     
     # Fallback in case the question ID isn't found
     return {"is_correct": False, "correct_answer": "Error: Question not found."}
-
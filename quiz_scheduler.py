@@ -0,0 +1,175 @@
+import random
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+# --- Per-learner quiz scheduling ---
+# Questions are addressed by their position in the bank (0 .. size - 1).
+# Each learner draws from their own shuffled deck: one step of a Fisher-Yates
+# shuffle per draw, so there are no repeats until the whole bank has been
+# seen, after which a new round starts. Missed questions go into a
+# spaced-repetition heap and come back after 2 draws, then 4, 8 and 16 as
+# they are answered correctly, after which they leave the heap.
+#
+# State is kept in arrays rather than lists of ints: a learner on a
+# 20-question bank costs a few hundred bytes, and on larger banks memory
+# follows the number of draws rather than the size of the bank.
+
+# Heap entries pack (due draw number, box, position) into one integer, so
+# ordering by entry orders by due draw.
+_DUE_SHIFT = 36
+_BOX_SHIFT = 32
+_POSITION_MASK = (1 << 32) - 1
+_BOX_MASK = 0xF
+MAX_BOX = 4
+
+# Banks up to this size get a dense one-byte-per-question array deck (at most
+# 256 bytes); larger banks record only the positions swapped so far.
+DENSE_DECK_LIMIT = 256
+
+
+def _heap_push(heap, entry):
+    heap.append(entry)
+    i = len(heap) - 1
+    while i:
+        parent = (i - 1) >> 1
+        if heap[parent] <= entry:
+            break
+        heap[i] = heap[parent]
+        i = parent
+    heap[i] = entry
+
+
+def _heap_pop(heap):
+    last = heap.pop()
+    if not heap:
+        return last
+    top = heap[0]
+    n = len(heap)
+    i = 0
+    while True:
+        child = 2 * i + 1
+        if child >= n:
+            break
+        if child + 1 < n and heap[child + 1] < heap[child]:
+            child += 1
+        if heap[child] >= last:
+            break
+        heap[i] = heap[child]
+        i = child
+    heap[i] = last
+    return top
+
+
+class _Learner:
+    __slots__ = ("deck", "cursor", "drawn", "reviews", "last_position", "last_box", "last_used")
+
+    def __init__(self, size, now):
+        if size <= DENSE_DECK_LIMIT:
+            self.deck = array("B", range(size))
+        else:
+            self.deck = {}  # position in deck -> question position, where they differ
+        self.cursor = 0
+        self.drawn = 0
+        self.reviews = array("Q")
+        self.last_position = -1
+        self.last_box = 0
+        self.last_used = now
+
+
+class QuizScheduler:
+    """Chooses each learner's next question and reschedules it from their answer.
+
+    ``size`` is the number of question positions in the bank. Learners idle
+    for longer than ``ttl`` seconds are forgotten, and only the
+    ``max_learners`` most recently active are kept.
+    """
+
+    def __init__(self, size, max_learners=500000, ttl=3600, rng=None):
+        self.size = size
+        self.max_learners = max_learners
+        self.ttl = ttl
+        self._learners = OrderedDict()  # learner id -> _Learner, least recently used first
+        self._lock = threading.Lock()
+        self._random = rng or random.Random()
+
+    def _learner(self, learner_id, now):
+        learner = self._learners.get(learner_id)
+        if learner is None or now - learner.last_used > self.ttl:
+            learner = self._learners[learner_id] = _Learner(self.size, now)
+        learner.last_used = now
+        self._learners.move_to_end(learner_id)
+        self._evict(now)
+        return learner
+
+    def _evict(self, now):
+        while self._learners:
+            oldest = next(iter(self._learners.values()))
+            if now - oldest.last_used <= self.ttl and len(self._learners) <= self.max_learners:
+                break
+            self._learners.popitem(last=False)
+
+    def _deal(self, learner):
+        """Next position from the learner's deck (one Fisher-Yates step)."""
+        if learner.cursor >= self.size:
+            learner.cursor = 0  # new round; keep shuffling the current order
+        i = learner.cursor
+        j = self._random.randrange(i, self.size)
+        deck = learner.deck
+        if isinstance(deck, array):
+            deck[i], deck[j] = deck[j], deck[i]
+            position = deck[i]
+        else:
+            position = deck.get(j, j)
+            if j != i:
+                deck[j] = deck.get(i, i)
+            deck.pop(i, None)
+        learner.cursor = i + 1
+        return position
+
+    def next_position(self, learner_id):
+        """Return the position of the question to show ``learner_id`` next."""
+        if not self.size:
+            return None
+        with self._lock:
+            learner = self._learner(learner_id, time.monotonic())
+            reviews = learner.reviews
+            if reviews and reviews[0] >> _DUE_SHIFT <= learner.drawn:
+                entry = _heap_pop(reviews)
+                learner.last_position = entry & _POSITION_MASK
+                learner.last_box = (entry >> _BOX_SHIFT) & _BOX_MASK
+            else:
+                learner.last_position = self._deal(learner)
+                learner.last_box = 0
+            learner.drawn += 1
+            return learner.last_position
+
+    def record(self, learner_id, position, correct):
+        """Reschedule ``position`` by whether it was answered ``correct``ly.
+
+        Only an answer to the question last shown to the learner counts, so
+        repeated or stale submissions do not pile up reviews.
+        """
+        with self._lock:
+            learner = self._learner(learner_id, time.monotonic())
+            if position != learner.last_position:
+                return
+            learner.last_position = -1
+            box = learner.last_box
+            if correct:
+                if box == 0 or box >= MAX_BOX:
+                    return  # known already, or graduated from review
+                box += 1
+            else:
+                box = 1
+            due = learner.drawn + (1 << box)
+            _heap_push(learner.reviews, due << _DUE_SHIFT | box << _BOX_SHIFT | position)
+
+    def forget(self, learner_id):
+        with self._lock:
+            self._learners.pop(learner_id, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._learners)
@@ -0,0 +1,283 @@
+import re
+import threading
+
+# --- Versioned rule tables ---
+
+class VersionedDict(dict):
+    """A dict that bumps ``version`` on every mutation.
+
+    Rule tables are plain module-level dicts that callers are free to edit, so
+    the compiled matchers built from them compare versions instead of
+    rebuilding on every call.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.version = 0
+
+    def _touch(self):
+        self.version += 1
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._touch()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._touch()
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._touch()
+
+    def setdefault(self, key, default=None):
+        value = super().setdefault(key, default)
+        self._touch()
+        return value
+
+    def pop(self, key, *default):
+        value = super().pop(key, *default)
+        self._touch()
+        return value
+
+    def popitem(self):
+        item = super().popitem()
+        self._touch()
+        return item
+
+    def clear(self):
+        super().clear()
+        self._touch()
+
+
+def match_case(replacement, original):
+    """Copy the capitalization pattern of ``original`` onto ``replacement``."""
+    if not replacement or not original:
+        return replacement
+    if original.isupper():
+        return replacement.upper()
+    if original[0].isupper():
+        return replacement[0].upper() + replacement[1:]
+    return replacement
+
+
+class CompiledRules:
+    """Base class for matchers compiled from a rule table.
+
+    Subclasses implement ``_build()`` returning the compiled form; it is
+    rebuilt lazily whenever the table's ``version`` changes (see
+    ``VersionedDict``). Plain dicts are compiled once.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        self._compiled = None  # (version, compiled form)
+
+    def _rules_version(self):
+        return getattr(self.rules, "version", 0)
+
+    def _build(self):
+        raise NotImplementedError
+
+    def compile(self):
+        """(Re)build the matcher from the current rules and return it."""
+        version = self._rules_version()
+        built = self._build()
+        self._compiled = (version, built)
+        return built
+
+    def _current(self):
+        compiled = self._compiled
+        if compiled is None or compiled[0] != self._rules_version():
+            return self.compile()
+        return compiled[1]
+
+
+# --- Grammar correction engine ---
+
+# A rule of the form \bliteral words\b with no other regex syntax.
+_LITERAL_RULE = re.compile(r"^\\b(\w[\w' ]*\w|\w)\\b$")
+
+
+def _trie_pattern(keys):
+    """Build a regex that matches any of ``keys``, structured as a prefix trie.
+
+    Python's ``re`` tries alternatives one after another, so a flat
+    ``a|b|c|...`` costs O(number of keys) at every position. Factoring the keys
+    into a trie means each position only walks the branches that share its
+    prefix. Terminal nodes make the remaining suffix optional, so the longest
+    key wins and the engine backtracks to a shorter one if needed.
+    """
+    trie = {}
+    for key in keys:
+        node = trie
+        for ch in key:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def _build(node):
+        branches = [re.escape(ch) + _build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            return "(?:" + body + ")?"
+        return body
+
+    return _build(trie)
+
+
+def _fold_lookup(literals, text):
+    """The first literal rule ``text`` matches case-insensitively, or None.
+
+    Under re.IGNORECASE some characters match letters they do not lower() to
+    (U+0130 and U+017F match "i" and "s", the Kelvin sign matches "k"), so a
+    plain dict lookup can miss. Those inputs are rare, so a scan is fine.
+    """
+    for key, rule in literals.items():
+        if re.fullmatch(re.escape(key), text, re.IGNORECASE):
+            return rule
+    return None
+
+
+class GrammarEngine(CompiledRules):
+    """Applies a table of ``{regex: replacement}`` rules in a single scan.
+
+    Literal rules (``\\bsome words\\b``, which is nearly all of them) are merged
+    into one trie-shaped pattern and resolved with a dict lookup; any other
+    regex rules are appended to the same alternation, each in its own capture
+    group. A call is therefore one left-to-right pass over the text, and the
+    cost per position depends on the text rather than on the number of rules.
+    At a given position the longest literal rule wins. Numbered
+    backreferences inside regex rules are not supported because group numbers
+    shift once the rules are merged.
+
+    ``hits`` counts how often each rule pattern has fired.
+    """
+
+    def __init__(self, rules):
+        super().__init__(rules)
+        self.hits = {}
+        self._hits_lock = threading.Lock()
+
+    def _build(self):
+        literals = {}
+        regex_rules = []
+        for pattern, fix in self.rules.items():
+            m = _LITERAL_RULE.match(pattern)
+            if m:
+                # Earlier rules win if two patterns only differ by case.
+                literals.setdefault(m.group(1).lower(), (pattern, fix))
+            else:
+                regex_rules.append((pattern, fix))
+
+        parts = []
+        replacements = {}
+        group = 1
+        if literals:
+            parts.append(r"\b(" + _trie_pattern(literals) + r")\b")
+            group += 1
+        for pattern, fix in regex_rules:
+            parts.append("(" + pattern + ")")
+            replacements[group] = (pattern, fix)
+            group += 1 + re.compile(pattern).groups
+        combined = re.compile("|".join(parts), re.IGNORECASE) if parts else None
+        return combined, literals, replacements
+
+    def apply(self, text):
+        """Return ``text`` with every rule applied, preserving case."""
+        combined, literals, replacements = self._current()
+        if combined is None or not text:
+            return text
+
+        def _repl(m):
+            orig = m.group(0)
+            # A rule's wrapping group closes last, so it is always lastindex.
+            if literals and m.lastindex == 1:
+                rule = literals.get(orig.lower()) or _fold_lookup(literals, orig)
+                if rule is None:
+                    return orig
+                pattern, fix = rule
+            else:
+                pattern, fix = replacements[m.lastindex]
+            with self._hits_lock:
+                self.hits[pattern] = self.hits.get(pattern, 0) + 1
+            return match_case(fix, orig)
+
+        return combined.sub(_repl, text)
+
+
+# --- Vocabulary phrase matcher ---
+
+_TOKEN = re.compile(r"\w+(?:'\w+)*")
+
+
+def tokenize(text):
+    """Return the lowercase word tokens of ``text``."""
+    return [t.lower() for t in _TOKEN.findall(text)]
+
+
+class PhraseMatcher(CompiledRules):
+    """Replaces whole-word phrases from a ``{phrase: replacement}`` table.
+
+    The phrases are compiled into a token trie. ``apply`` tokenizes the text
+    once and, at each token, follows the trie as far as the following tokens
+    allow (tokens must be separated by whitespace only), keeping the longest
+    phrase found. Matched spans are replaced and scanning resumes after them,
+    so the cost depends on the text length rather than the table size.
+
+    ``replacements`` counts the phrases replaced so far.
+    """
+
+    def __init__(self, rules):
+        super().__init__(rules)
+        self.replacements = 0
+        self._count_lock = threading.Lock()
+
+    def _build(self):
+        trie = {}
+        for phrase, replacement in self.rules.items():
+            tokens = tokenize(phrase)
+            if not tokens:
+                continue
+            node = trie
+            for token in tokens:
+                node = node.setdefault(token, {})
+            node[None] = replacement
+        return trie
+
+    def apply(self, text):
+        """Return ``text`` with the longest matching phrases replaced, preserving case."""
+        trie = self._current()
+        if not trie or not text:
+            return text
+        spans = [(m.start(), m.end(), m.group(0).lower()) for m in _TOKEN.finditer(text)]
+        pieces = []
+        last = 0
+        i = 0
+        while i < len(spans):
+            node = trie.get(spans[i][2])
+            match = None
+            j = i
+            while node is not None:
+                if None in node:
+                    match = (j, node[None])
+                j += 1
+                if j >= len(spans) or text[spans[j - 1][1]:spans[j][0]].strip():
+                    break
+                node = node.get(spans[j][2])
+            if match is None:
+                i += 1
+                continue
+            end_index, replacement = match
+            start, end = spans[i][0], spans[end_index][1]
+            pieces.append(text[last:start])
+            pieces.append(match_case(replacement, text[start:end]))
+            last = end
+            i = end_index + 1
+        if not pieces:
+            return text
+        with self._count_lock:
+            self.replacements += len(pieces) // 2
+        pieces.append(text[last:])
+        return "".join(pieces)
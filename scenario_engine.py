@@ -0,0 +1,138 @@
+import json
+import os
+from string import Formatter
+
+from rule_engine import CompiledRules, tokenize
+
+# --- Scenario compiler ---
+# Scenarios are written as plain dicts (see ai_logic.SCENARIOS or the JSON
+# files in scenario_data/). A step may have:
+#   bot         message shown when the step is reached; may use {placeholders}
+#   keywords    words/phrases the learner must use to move on
+#   accept_any  move on whatever the learner says
+#   options     [{"keywords": [...], "next_step": ...}] to branch
+#   next_step   the step that follows
+#   slots       {"name": [values...]}: remember the first value found in the
+#               learner's message, in list order, for use in later templates
+#   feedback    closing message; the scenario ends after this step
+# Compiling validates this once and precomputes keyword sets and templates,
+# so a message is tokenized once and matched with set lookups.
+
+
+class ScenarioError(ValueError):
+    """Raised when a scenario definition is invalid."""
+
+
+def _compile_keywords(keywords, where):
+    """Split keywords into a set of single tokens and a tuple of multi-token phrases."""
+    if not isinstance(keywords, (list, tuple)):
+        raise ScenarioError(f"{where}: keywords must be a list")
+    single = set()
+    phrases = []
+    for kw in keywords:
+        tokens = tuple(tokenize(kw))
+        if not tokens:
+            raise ScenarioError(f"{where}: keyword {kw!r} has no words")
+        if len(tokens) == 1:
+            single.add(tokens[0])
+        else:
+            phrases.append(tokens)
+    return frozenset(single), tuple(phrases)
+
+
+def _template_fields(template, where):
+    try:
+        return tuple(name for _, name, _, _ in Formatter().parse(template) if name is not None)
+    except ValueError as e:
+        raise ScenarioError(f"{where}: bad template: {e}")
+
+
+def compile_scenario(scenario_id, scenario):
+    """Validate one scenario definition and return its compiled form."""
+    where = f"scenario {scenario_id!r}"
+    steps = scenario.get("steps")
+    if not isinstance(steps, dict) or not steps:
+        raise ScenarioError(f"{where}: no steps")
+    start_step = scenario.get("start_step")
+    if start_step not in steps:
+        raise ScenarioError(f"{where}: start_step {start_step!r} is not a step")
+
+    compiled_steps = {}
+    for step_id, step in steps.items():
+        step_where = f"{where}, step {step_id!r}"
+        bot = step.get("bot", "...")
+        options = []
+        for option in step.get("options", []):
+            options.append((_compile_keywords(option.get("keywords", []), step_where), option.get("next_step")))
+        slots = []
+        for name, values in step.get("slots", {}).items():
+            slots.append((name, [(value, _compile_keywords([value], step_where)) for value in values]))
+        compiled = {
+            "bot": bot,
+            "fields": _template_fields(bot, step_where),
+            "keywords": list(step.get("keywords", [])),
+            "keyword_match": _compile_keywords(step.get("keywords", []), step_where),
+            "accept_any": bool(step.get("accept_any", False)),
+            "options": options,
+            "option_keywords": sorted(set(k for opt in step.get("options", []) for k in opt.get("keywords", []))),
+            "next_step": step.get("next_step"),
+            "slots": slots,
+        }
+        if "feedback" in step:
+            compiled["feedback"] = step["feedback"]
+        compiled_steps[step_id] = compiled
+
+    for step_id, compiled in compiled_steps.items():
+        targets = [compiled["next_step"]] + [next_step for _, next_step in compiled["options"]]
+        for target in targets:
+            if target is not None and target not in compiled_steps:
+                raise ScenarioError(f"{where}, step {step_id!r}: next_step {target!r} is not a step")
+
+    return {"title": scenario.get("title", scenario_id), "start_step": start_step, "steps": compiled_steps}
+
+
+class ScenarioTable(CompiledRules):
+    """All scenarios compiled once; recompiled when the scenario table changes."""
+
+    def _build(self):
+        return {scenario_id: compile_scenario(scenario_id, scenario) for scenario_id, scenario in self.rules.items()}
+
+    def get(self, scenario_id):
+        return self._current().get(scenario_id)
+
+
+def load_scenario_files(directory):
+    """Read every ``*.json`` scenario in ``directory``; the file name is the scenario id."""
+    scenarios = {}
+    if not os.path.isdir(directory):
+        return scenarios
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".json"):
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                scenario = json.load(f)
+            scenario_id = name[:-5]
+            compile_scenario(scenario_id, scenario)  # fail at load time, not mid-conversation
+            scenarios[scenario_id] = scenario
+    return scenarios
+
+
+# --- Matching ---
+
+class Message:
+    """A learner message tokenized once for keyword and slot matching."""
+
+    def __init__(self, text):
+        self.tokens = tokenize(text) if isinstance(text, str) else []
+        self.words = frozenset(self.tokens)
+
+    def has_phrase(self, phrase):
+        n = len(phrase)
+        tokens = self.tokens
+        return any(tuple(tokens[i:i + n]) == phrase for i in range(len(tokens) - n + 1))
+
+    def matches(self, keyword_match):
+        """True if any compiled keyword (see _compile_keywords) occurs in the message."""
+        single, phrases = keyword_match
+        if not single.isdisjoint(self.words):
+            return True
+        return any(self.has_phrase(phrase) for phrase in phrases)
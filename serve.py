@@ -0,0 +1,138 @@
+import argparse
+import gc
+import os
+import time
+
+from gunicorn.app.base import BaseApplication
+
+# --- Production server ---
+# ``python serve.py`` runs the app under gunicorn's prefork server. The
+# parent process imports the app and compiles the rule tables, scenarios,
+# fuzzy index, quiz index, static assets and templates once. It then calls
+# gc.freeze(), so the collector never touches those objects and the pages
+# stay shared copy-on-write by every worker. Each worker answers one request on every
+# endpoint before it accepts traffic, which fills its per-process caches.
+#
+# Graceful restart: SIGHUP replaces the workers once their in-flight requests
+# finish (preloaded code is kept). To deploy new code, send SIGUSR2 and then
+# SIGQUIT to the old master. CHATBOT_MAX_REQUESTS recycles each worker after
+# that many requests.
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def preload():
+    """Import the app and build everything the workers will share."""
+    gc.disable()  # no collections while the long-lived tables are built
+    import ai_logic
+    import quiz_logic
+    from app import app, static_assets
+
+    ai_logic.compile_tables()
+    quiz_logic.warm_quiz_bank()
+    static_assets.load()
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    gc.collect()
+    gc.freeze()
+    gc.enable()
+    return app
+
+
+def warmup(app):
+    """Send one request to every endpoint (except speech synthesis) and return the time taken."""
+    import ai_logic
+    import event_log
+    import quiz_logic
+    from session_store import MemoryBackend
+
+    # Warmup answers are not a learner's, so keep them out of the analytics log,
+    # and hold the warmup chat in a throwaway store rather than the shared one.
+    recorder, event_log.recorder = event_log.recorder, None
+    store = ai_logic.session_store
+    ai_logic.configure_session_store(MemoryBackend())
+    warmup_id = f"warmup-{os.getpid()}"
+    try:
+        return _warm(app, ai_logic, warmup_id)
+    finally:
+        event_log.recorder = recorder
+        ai_logic.configure_session_store(store)
+        if quiz_logic.quiz_scheduler is not None:
+            quiz_logic.quiz_scheduler.forget(warmup_id)
+
+
+def _warm(app, ai_logic, warmup_id):
+    from app import QUIZ_COOKIE
+
+    start = time.perf_counter()
+    client = app.test_client()
+    for page in ("/", "/tutor", "/quiz", "/api/tts/stats", "/metrics"):
+        client.get(page)
+    for action in ("grammar", "vocabulary", "explain"):
+        client.post("/api/process", json={"text": "i has a apple", "action": action})
+    client.post("/api/grammar/incremental", json={"text": "i has a apple. he go home."})
+    client.post("/api/process/batch", json={"items": [{"text": "i is happy", "action": "grammar"}]})
+    for scenario_id in ai_logic.SCENARIOS:
+        client.post("/api/chat", json={"message": "hello", "scenario": scenario_id, "session_id": warmup_id})
+    client.set_cookie(QUIZ_COOKIE, warmup_id)
+    question = client.get("/api/quiz/new").get_json()
+    if "question_id" in question:  # the bank may be empty
+        client.post("/api/quiz/check", json={"question_id": question["question_id"], "answer": question["options"][0]})
+    return time.perf_counter() - start
+
+
+class ChatbotServer(BaseApplication):
+    """Gunicorn application that preloads the app before forking workers."""
+
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+        self.cfg.set("preload_app", True)
+        self.cfg.set("pre_fork", lambda server, worker: gc.freeze())
+        self.cfg.set("post_worker_init", self._warm_worker)
+
+    def _warm_worker(self, worker):
+        try:
+            elapsed = warmup(worker.wsgi)
+        except Exception:
+            # A cold worker is still better than none.
+            worker.log.exception("Warmup failed in worker %s", worker.pid)
+        else:
+            worker.log.info("Worker %s warmed up in %.0f ms", worker.pid, elapsed * 1000)
+
+    def load(self):
+        return preload()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the chatbot with preforked, prewarmed workers.")
+    parser.add_argument("--bind", default=os.environ.get("CHATBOT_BIND", "0.0.0.0:8000"))
+    parser.add_argument("--workers", type=int, default=_env_int("CHATBOT_WORKERS", (os.cpu_count() or 1) * 2 + 1))
+    parser.add_argument("--threads", type=int, default=_env_int("CHATBOT_THREADS", 4),
+                        help="threads per worker; more than 1 uses the gthread worker")
+    parser.add_argument("--timeout", type=int, default=_env_int("CHATBOT_TIMEOUT", 60),
+                        help="seconds before a silent worker is killed and replaced")
+    parser.add_argument("--graceful-timeout", type=int, default=_env_int("CHATBOT_GRACEFUL_TIMEOUT", 30),
+                        help="seconds workers get to finish in-flight requests on restart or shutdown")
+    parser.add_argument("--max-requests", type=int, default=_env_int("CHATBOT_MAX_REQUESTS", 0),
+                        help="recycle a worker after this many requests (0 = never)")
+    args = parser.parse_args(argv)
+    ChatbotServer({
+        "bind": args.bind,
+        "workers": args.workers,
+        "threads": args.threads,
+        "timeout": args.timeout,
+        "graceful_timeout": args.graceful_timeout,
+        "max_requests": args.max_requests,
+        "max_requests_jitter": args.max_requests // 10,
+    }).run()
+
+
+if __name__ == "__main__":
+    main()
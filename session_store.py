@@ -0,0 +1,123 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# --- Session state backends ---
+# Both backends expose the same small interface: get(session_id) returns the
+# stored state dict (or None), set(session_id, state) stores it and
+# delete(session_id) forgets it. Sessions idle for longer than ``ttl`` seconds
+# are dropped, and only the ``max_sessions`` most recently used are kept.
+
+
+class MemoryBackend:
+    """Thread-safe in-process store with LRU and idle-TTL eviction."""
+
+    def __init__(self, max_sessions=10000, ttl=1800):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._data = OrderedDict()  # session_id -> (last_used, state), oldest first
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        # Entries are kept in last-used order, so expired ones sit at the front.
+        while self._data:
+            _, (last_used, _) = next(iter(self._data.items()))
+            if now - last_used <= self.ttl and len(self._data) <= self.max_sessions:
+                break
+            self._data.popitem(last=False)
+
+    def get(self, session_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(session_id)
+            if entry is None:
+                return None
+            if now - entry[0] > self.ttl:
+                del self._data[session_id]
+                return None
+            self._data[session_id] = (now, entry[1])
+            self._data.move_to_end(session_id)
+            return entry[1]
+
+    def set(self, session_id, state):
+        now = time.monotonic()
+        with self._lock:
+            self._data[session_id] = (now, state)
+            self._data.move_to_end(session_id)
+            self._evict(now)
+
+    def delete(self, session_id):
+        with self._lock:
+            self._data.pop(session_id, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class SQLiteBackend:
+    """Store shared by several worker processes through one SQLite file.
+
+    Each thread keeps its own connection. Expired and surplus sessions are
+    purged every ``purge_every`` writes rather than on each request.
+    """
+
+    def __init__(self, path, max_sessions=100000, ttl=1800, purge_every=500):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.purge_every = purge_every
+        self._local = threading.local()
+        self._writes = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions "
+                "(id TEXT PRIMARY KEY, state TEXT NOT NULL, updated REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, session_id):
+        now = time.time()
+        row = self._connect().execute(
+            "SELECT state FROM sessions WHERE id = ? AND updated >= ?", (session_id, now - self.ttl)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, session_id, state):
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (id, state, updated) VALUES (?, ?, ?)",
+            (session_id, json.dumps(state), time.time()),
+        )
+        self._writes += 1
+        if self._writes % self.purge_every == 0:
+            self.purge()
+
+    def delete(self, session_id):
+        self._connect().execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def purge(self):
+        """Drop expired sessions and everything beyond ``max_sessions``."""
+        conn = self._connect()
+        conn.execute("DELETE FROM sessions WHERE updated < ?", (time.time() - self.ttl,))
+        conn.execute(
+            "DELETE FROM sessions WHERE id IN "
+            "(SELECT id FROM sessions ORDER BY updated DESC LIMIT -1 OFFSET ?)",
+            (self.max_sessions,),
+        )
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
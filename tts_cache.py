@@ -0,0 +1,460 @@
+import hashlib
+import io
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+from metrics import REGISTRY, Counter
+
+_synthesis_seconds = REGISTRY.histogram(
+    "chatbot_tts_synthesis_seconds", "Latency of speech synthesizer calls.", ["synthesizer"])
+_synthesis_failures = REGISTRY.counter(
+    "chatbot_tts_synthesis_failures_total", "Speech synthesizer calls that raised.", ["synthesizer"])
+_synthesis_pending = REGISTRY.gauge(
+    "chatbot_tts_pending", "Synthesis jobs queued or running on the synthesis pool.")
+_synthesis_rejected = REGISTRY.counter(
+    "chatbot_tts_rejected_total", "Speech requests turned away, by reason.", ["reason"])
+
+# --- Synthesizers ---
+# A synthesizer is any callable taking (text, lang) and returning MP3 bytes.
+
+
+class GTTSSynthesizer:
+    """Synthesizes speech with Google Text-to-Speech (network round-trip)."""
+
+    def __call__(self, text, lang):
+        from gtts import gTTS
+        mp3_fp = io.BytesIO()
+        gTTS(text, lang=lang).write_to_fp(mp3_fp)
+        return mp3_fp.getvalue()
+
+
+class FakeSynthesizer:
+    """Local stand-in for gTTS: returns deterministic bytes after ``delay`` seconds."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, text, lang):
+        with self._lock:
+            self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        return b"FAKE-MP3:" + lang.encode() + b":" + text.encode("utf-8")
+
+
+# --- Synthesis pool ---
+# Synthesis runs on a few dedicated threads with a bounded queue in front, so
+# a burst of speech requests cannot tie up the server. Once the queue is full
+# new jobs are refused at once; the caller answers 503 with Retry-After.
+#
+# The queue has two lanes. Jobs someone is waiting on right now (a /api/tts
+# request, the chunk a stream is about to play) go first; chunks that a
+# stream fetches ahead of playback run only when no one is waiting, and on
+# at most half the threads, so one long text cannot delay the first audio of
+# every other request.
+
+
+class SynthesisBusy(Exception):
+    """Speech could not be produced now; try again after ``retry_after`` seconds."""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class SynthesisTimeout(SynthesisBusy):
+    """Synthesis did not finish in time (it keeps running and is cached when done)."""
+
+
+class SynthesisPool:
+    """At most ``workers`` concurrent synthesis jobs plus ``max_queue`` waiting ones.
+
+    Threads are started on the first job, not when the pool is created.
+    """
+
+    def __init__(self, workers=2, max_queue=8):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._pending = 0
+        self._average = 1.0  # seconds per job, moving average
+        self._lock = threading.Lock()
+        self._queued = threading.Condition(self._lock)
+        self._urgent = deque()  # (future, fn, args)
+        self._background = deque()
+        self._background_running = 0
+        self._threads = 0
+        self._pid = None
+
+    def retry_after(self):
+        """Seconds until the current backlog should have drained."""
+        with self._lock:
+            return max(1, math.ceil(self._pending * self._average / self.workers))
+
+    def submit(self, fn, *args, background=False):
+        """Queue ``fn(*args)`` and return its Future; ``background`` jobs wait for the urgent lane to empty."""
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                busy = True
+            else:
+                busy = False
+                self._pending += 1
+                future = Future()
+                (self._background if background else self._urgent).append((future, fn, args))
+                self._start_thread()
+                self._queued.notify()
+        if busy:
+            _synthesis_rejected.inc("queue_full")
+            raise SynthesisBusy("speech synthesis queue is full", self.retry_after())
+        _synthesis_pending.inc()
+        return future
+
+    def promote(self, future):
+        """Move a queued background job to the urgent lane, because someone now waits for it."""
+        with self._lock:
+            for job in self._background:
+                if job[0] is future:
+                    self._background.remove(job)
+                    self._urgent.append(job)
+                    return
+
+    def _start_thread(self):
+        # Called with the lock held. After a fork the threads stay behind in the parent.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._threads = 0
+        if self._threads < self.workers:
+            self._threads += 1
+            threading.Thread(target=self._work, name=f"tts-synth-{self._threads}", daemon=True).start()
+
+    def _work(self):
+        while True:
+            with self._queued:
+                while not (self._urgent or self._background and
+                           self._background_running < max(1, self.workers // 2)):
+                    self._queued.wait()
+                background = not self._urgent
+                future, fn, args = (self._background if background else self._urgent).popleft()
+                self._background_running += background
+            try:
+                self._run(future, fn, args)
+            finally:
+                if background:
+                    with self._queued:
+                        self._background_running -= 1
+                        self._queued.notify()
+
+    def _run(self, future, fn, args):
+        start = time.perf_counter()
+        try:
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args))
+                except BaseException as e:
+                    future.set_exception(e)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._pending -= 1
+                self._average += (elapsed - self._average) * 0.2
+            _synthesis_pending.dec()
+
+    def pending(self):
+        with self._lock:
+            return self._pending
+
+
+# --- Audio cache ---
+
+def audio_key(text, lang):
+    """Content address of a (text, lang) pair."""
+    return hashlib.sha256(f"{lang}\0{text}".encode("utf-8")).hexdigest()
+
+
+class AudioCache:
+    """Two-tier cache of synthesized audio keyed by a hash of (text, lang).
+
+    Lookups go to a bounded in-memory LRU first, then to an optional on-disk
+    store capped at ``disk_max_bytes`` (least recently used files are removed
+    first). On a miss, concurrent requests for the same key wait for a single
+    synthesis instead of each calling the synthesizer.
+
+    With a ``pool`` (a SynthesisPool), misses are synthesized there and
+    callers wait at most ``timeout`` seconds; otherwise the calling thread
+    runs the synthesizer itself. A prebuilt ``pack`` (audio_pack.AudioPack)
+    is consulted before everything else.
+    """
+
+    def __init__(self, synthesizer, memory_items=256, disk_dir=None, disk_max_bytes=200 * 1024 * 1024,
+                 pool=None, timeout=None, pack=None):
+        self.synthesizer = synthesizer
+        self.pack = pack
+        self.pool = pool
+        self.timeout = timeout
+        self.memory_items = memory_items
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._memory = OrderedDict()  # key -> bytes
+        self._disk = None  # key -> size, least recently used first; listed on first use
+        self._disk_bytes = 0
+        self._inflight = {}  # key -> [threading.Event, result bytes, error]
+        self._lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "errors": 0, "rejected": 0,
+                         "pack_hits": 0}
+
+    def _load_disk_index(self):
+        # Called with self._lock held, on first use rather than at import,
+        # since listing a large cache directory takes a while.
+        os.makedirs(self.disk_dir, exist_ok=True)
+        self._disk = OrderedDict()
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith(".mp3"):
+                stat = os.stat(os.path.join(self.disk_dir, name))
+                entries.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key + ".mp3")
+
+    # The helpers below are called with self._lock held.
+
+    def _remember(self, key, audio):
+        self._memory[key] = audio
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _read_disk(self, key):
+        if self._disk is None:
+            self._load_disk_index()
+        if key not in self._disk:
+            return None
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                audio = f.read()
+        except OSError:
+            self._disk_bytes -= self._disk.pop(key)
+            return None
+        self._disk.move_to_end(key)
+        return audio
+
+    def _index_disk(self, key, size):
+        self._disk_bytes += size - self._disk.pop(key, 0)
+        self._disk[key] = size
+        while self._disk_bytes > self.disk_max_bytes and len(self._disk) > 1:
+            old_key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            try:
+                os.remove(self._disk_path(old_key))
+            except OSError:
+                pass
+
+    def _write_disk(self, key, audio):
+        """Atomically write ``audio`` to the disk store; returns False on failure."""
+        tmp_path = self._disk_path(key) + f".{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(audio)
+            os.replace(tmp_path, self._disk_path(key))
+        except OSError:
+            return False
+        return True
+
+    def get(self, text, lang="en"):
+        """Return MP3 bytes for ``text``, synthesizing at most once per key."""
+        return self.wait(self.fetch(text, lang))
+
+    def fetch(self, text, lang="en", background=False):
+        """Start producing the audio for ``text`` without waiting for it; pass the result to ``wait``.
+
+        With a pool, a miss is queued there (or refused, if it is full) and
+        this returns at once; without one, the synthesizer runs here. A
+        ``background`` fetch is for audio not needed yet (see SynthesisPool).
+        """
+        if self.pack is not None:
+            audio = self.pack.get(text, lang)
+            if audio is not None:
+                with self._lock:
+                    self.counters["pack_hits"] += 1
+                return _ready(audio)
+        key = audio_key(text, lang)
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return _ready(audio)
+            if self.disk_dir:
+                audio = self._read_disk(key)
+                if audio is not None:
+                    self._remember(key, audio)
+                    self.counters["disk_hits"] += 1
+                    return _ready(audio)
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = [threading.Event(), None, None, None]
+                self.counters["misses"] += 1
+
+        if leader:
+            if self.pool is None:
+                self._synthesize(key, text, lang, flight)
+            else:
+                try:
+                    flight[3] = self.pool.submit(self._synthesize, key, text, lang, flight, background=background)
+                except SynthesisBusy as e:
+                    self._fail(key, flight, e, "rejected")
+        elif not background:
+            self.promote(flight)
+        return flight
+
+    def promote(self, flight):
+        """Someone is now waiting for ``flight``: move it ahead of fetched-ahead work."""
+        if self.pool is not None and flight[3] is not None:
+            self.pool.promote(flight[3])
+
+    def wait(self, flight):
+        """MP3 bytes for a ``fetch``, waiting at most ``timeout`` seconds."""
+        if not flight[0].wait(self.timeout):
+            _synthesis_rejected.inc("timeout")
+            retry_after = self.pool.retry_after() if self.pool is not None else 1
+            raise SynthesisTimeout(f"speech synthesis took longer than {self.timeout}s", retry_after)
+        if flight[2] is not None:
+            raise flight[2]
+        return flight[1]
+
+    def _fail(self, key, flight, error, outcome="errors"):
+        with self._lock:
+            self.counters[outcome] += 1
+            del self._inflight[key]
+        flight[2] = error
+        flight[0].set()
+
+    def _synthesize(self, key, text, lang, flight):
+        """Run the synthesizer for one missed key and hand the result to its waiters."""
+        synthesizer_name = type(self.synthesizer).__name__
+        start = time.perf_counter()
+        try:
+            audio = self.synthesizer(text, lang)
+        except Exception as e:
+            _synthesis_failures.inc(synthesizer_name)
+            self._fail(key, flight, e)
+            return
+        finally:
+            _synthesis_seconds.observe(synthesizer_name, value=time.perf_counter() - start)
+        written = bool(self.disk_dir) and self._write_disk(key, audio)
+        with self._lock:
+            self._remember(key, audio)
+            if written:
+                self._index_disk(key, len(audio))
+            del self._inflight[key]
+        flight[1] = audio
+        flight[0].set()
+
+    def collect(self):
+        """Cache counters as metrics, for Registry.add_collector."""
+        counters = Counter("chatbot_tts_cache_total", "Audio cache lookups by outcome.", ["outcome"])
+        with self._lock:
+            snapshot = dict(self.counters)
+        for outcome, n in snapshot.items():
+            counters.inc(outcome, amount=n)
+        return [counters]
+
+    def stats(self):
+        """Return hit/miss counters and current cache sizes."""
+        with self._lock:
+            stats = dict(self.counters)
+            stats["memory_items"] = len(self._memory)
+            if self.disk_dir and self._disk is None:
+                self._load_disk_index()
+            stats["disk_items"] = len(self._disk) if self._disk is not None else 0
+            stats["disk_bytes"] = self._disk_bytes
+        if self.pack is not None:
+            stats["pack_items"] = len(self.pack)
+        if self.pool is not None:
+            stats["pending"] = self.pool.pending()
+        return stats
+
+
+def _ready(audio):
+    """A finished flight: [done event, audio, error, pool job], as ``fetch`` returns for a miss."""
+    flight = [threading.Event(), audio, None, None]
+    flight[0].set()
+    return flight
+
+
+def _rejected(flight):
+    """True if ``flight`` was turned away by a full synthesis pool."""
+    return flight[0].is_set() and type(flight[2]) is SynthesisBusy
+
+
+# --- Streaming synthesis ---
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def split_sentences(text, max_chars=300):
+    """Split ``text`` at sentence boundaries into non-empty chunks.
+
+    Sentences longer than ``max_chars`` are further split at the last space
+    before the limit so that no single chunk holds up playback for long.
+    """
+    chunks = []
+    for sentence in _SENTENCE_END.split(text.strip()):
+        sentence = sentence.strip()
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            chunks.append(sentence[:cut])
+            sentence = sentence[cut:].strip()
+        if sentence:
+            chunks.append(sentence)
+    return chunks
+
+
+class SpeechStreamer:
+    """Synthesizes long texts sentence by sentence, keeping a few chunks in flight.
+
+    ``stream`` yields the MP3 segment of each chunk in order as soon as it is
+    ready, with at most ``prefetch`` chunks in flight per request. Chunks are
+    fetched through the audio cache, so they share its synthesis pool: a
+    full queue refuses them with SynthesisBusy and each one is waited for at
+    most the cache's ``timeout``, as for a single /api/tts request. Chunks
+    fetched ahead go in the pool's background lane, so other requests' first
+    audio is not queued behind them. Repeated sentences are not re-synthesized.
+    """
+
+    def __init__(self, cache, prefetch=2):
+        self.cache = cache
+        self.prefetch = prefetch
+
+    def stream(self, text, lang="en"):
+        chunks = split_sentences(text)
+        # Without a pool, fetch synthesizes inline, so fetching ahead would only delay this chunk.
+        prefetch = self.prefetch if self.cache.pool is not None else 1
+        ahead = deque()  # flights for the chunks after the current one
+        for i, chunk in enumerate(chunks):
+            if not ahead:
+                flight = self.cache.fetch(chunk, lang)
+            else:
+                flight = ahead.popleft()
+                if _rejected(flight):
+                    # Fetched ahead while the queue was full; it is needed now, so ask again.
+                    flight = self.cache.fetch(chunk, lang)
+                else:
+                    self.cache.promote(flight)
+            for j in range(i + 1 + len(ahead), min(len(chunks), i + prefetch)):
+                ahead.append(self.cache.fetch(chunks[j], lang, background=True))
+                if _rejected(ahead[-1]):
+                    break
+            yield self.cache.wait(flight)